@@ -0,0 +1,181 @@
+"""Benchmark the DCF demo animation build
+
+Runs the timeline from make-dcf-animation.py under several render modes and
+resolutions, each in a fresh process so peak memory is per configuration, and
+writes the results as JSON so build times can be compared across changes:
+
+    python benchmark-dcf-animation.py --dpi 75,150 --output bench.json
+
+Every mode is run with each render backend given by --backends (matplotlib's
+Agg, or the NumPy/Pillow raster compositor).
+
+Modes:
+    serial    every frame fully redrawn, nothing reused (the original pipeline)
+    blit      dirty-rect blitting, but every frame still rendered
+    dedupe    blitting, and runs of identical frames rendered once (default build)
+    parallel  dedupe, rasterized by --jobs worker processes
+"""
+import argparse
+import collections
+import datetime
+import importlib.util
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'make-dcf-animation.py')
+
+def load_animation():
+    """Import make-dcf-animation.py as a module (importing it has no side effects)"""
+    spec = importlib.util.spec_from_file_location('dcf_animation', SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    # Registered so worker processes can unpickle its functions
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+dcf = load_animation()
+
+MODES = {
+    'serial': dict(blit=False, dedupe=False, parallel=False),
+    'blit': dict(blit=True, dedupe=False, parallel=False),
+    'dedupe': dict(blit=True, dedupe=True, parallel=False),
+    'parallel': dict(blit=True, dedupe=True, parallel=True),
+}
+
+class TimedSink:
+    """Wrap a sink, adding up the time spent in it"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.seconds = 0.0
+
+    def write(self, frame, repeat=1):
+        start = time.perf_counter()
+        self.sink.write(frame, repeat)
+        self.seconds += time.perf_counter() - start
+
+    def close(self):
+        start = time.perf_counter()
+        self.sink.close()
+        self.seconds += time.perf_counter() - start
+
+def peak_rss_mb(who):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def run_config(mode, backend, dpi, formats, jobs):
+    """Build once with the given settings in this process and return the measurements"""
+    settings = MODES[mode]
+    dcf.DPI = dpi
+    dcf.use_backend(backend)
+    dcf.scene.blit = settings['blit']
+
+    # Time scene building and rasterizing per phase. export() looks both up
+    # at call time; worker processes keep their own timings, so phases are
+    # only reported for in-process modes.
+    phases = collections.defaultdict(lambda: [0, 0.0])
+    current = [None]
+    update, render = dcf.update, dcf.scene.render
+
+    def timed_update(frame_data):
+        current[0] = frame_data.get('phase')
+        start = time.perf_counter()
+        update(frame_data)
+        phases[current[0]][1] += time.perf_counter() - start
+
+    def timed_render():
+        start = time.perf_counter()
+        frame = render()
+        phases[current[0]][0] += 1
+        phases[current[0]][1] += time.perf_counter() - start
+        return frame
+
+    dcf.update, dcf.scene.render = timed_update, timed_render
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        sinks = {}
+        for name in formats:
+            output = dcf.OUTPUT_FORMATS[name]
+            sinks[name] = TimedSink(output.make_sink(os.path.join(out_dir, output.filename), 10, 'web'))
+        start = time.perf_counter()
+        written, rendered = dcf.export(dcf.timeline, list(sinks.values()),
+                                       jobs=jobs if settings['parallel'] else 1, dedupe=settings['dedupe'])
+        wall = time.perf_counter() - start
+        outputs = {name: dict(bytes=os.path.getsize(timed.sink.path),
+                              encode_ms_per_frame=1000 * timed.seconds / written)
+                   for name, timed in sinks.items()}
+
+    encode = sum(timed.seconds for timed in sinks.values())
+    return dict(
+        mode=mode, backend=backend, dpi=dpi, jobs=jobs if settings['parallel'] else 1, **settings,
+        size=list(dcf.scene.size),
+        frames_written=written, frames_rendered=rendered,
+        wall_seconds=wall,
+        # Everything that isn't encoding: scene updates, rasterizing, and
+        # waiting on workers in parallel mode
+        render_ms_per_frame=1000 * (wall - encode) / rendered,
+        phases={phase: dict(frames=count, render_ms_per_frame=1000 * seconds / count)
+                for phase, (count, seconds) in phases.items() if count},
+        outputs=outputs,
+        peak_rss_mb=peak_rss_mb(resource.RUSAGE_SELF),
+        peak_rss_children_mb=peak_rss_mb(resource.RUSAGE_CHILDREN),
+        text_cache=dict(hits=dcf.text_cache.hits, misses=dcf.text_cache.misses),
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the DCF demo animation build")
+    parser.add_argument('--modes', default=','.join(MODES), help=f"comma-separated modes (default: all of {','.join(MODES)})")
+    parser.add_argument('--backends', default=','.join(dcf.BACKENDS),
+                        help=f"comma-separated render backends (default: all of {','.join(dcf.BACKENDS)})")
+    parser.add_argument('--dpi', default='75,150', help="comma-separated figure DPIs (default: 75,150)")
+    parser.add_argument('--formats', default='mp4,gif', help=f"comma-separated outputs from {','.join(dcf.OUTPUT_FORMATS)} (default: mp4,gif)")
+    parser.add_argument('--jobs', type=int, default=max(2, os.cpu_count() or 1), help="workers for parallel mode (default: CPU count)")
+    parser.add_argument('--output', default='dcf-benchmark.json', help="where to write the JSON results")
+    # Internal: run a single configuration and print its result
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        config = json.loads(args.run)
+        print(json.dumps(run_config(**config)))
+        return
+
+    results = []
+    configs = itertools.product([int(dpi) for dpi in args.dpi.split(',')], args.backends.split(','), args.modes.split(','))
+    for dpi, backend, mode in configs:
+        config = dict(mode=mode, backend=backend, dpi=dpi, formats=args.formats.split(','), jobs=args.jobs)
+        # A fresh interpreter per configuration: no warm caches, and peak RSS is its own
+        proc = subprocess.run([sys.executable, __file__, '--run', json.dumps(config)],
+                              capture_output=True, text=True, check=True)
+        result = json.loads(proc.stdout.splitlines()[-1])
+        results.append(result)
+        outputs = ', '.join(f"{name} {output['bytes'] / 1024:.0f}KB @ {output['encode_ms_per_frame']:.1f}ms/frame"
+                            for name, output in result['outputs'].items())
+        print(f"{mode:>8} {backend:>6} @ {dpi} dpi: {result['wall_seconds']:.1f}s, "
+              f"render {result['render_ms_per_frame']:.1f}ms/frame ({result['frames_rendered']} rendered), "
+              f"encode {outputs}, peak RSS {result['peak_rss_mb']:.0f}MB")
+
+    report = dict(
+        date=datetime.datetime.now().isoformat(timespec='seconds'),
+        platform=platform.platform(),
+        python=platform.python_version(),
+        matplotlib=matplotlib.__version__,
+        cpu_count=os.cpu_count(),
+        results=results,
+    )
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✓ Results saved to {args.output}")
+
+if __name__ == '__main__':
+    main()
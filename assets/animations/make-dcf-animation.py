@@ -1,17 +1,65 @@
+import matplotlib as mpl
 import matplotlib.pyplot as plt
 import matplotlib.patches as patches
-from matplotlib.animation import FuncAnimation, PillowWriter
-from matplotlib.offsetbox import OffsetImage, AnnotationBbox
+from matplotlib.artist import Artist
 from matplotlib import font_manager
+from matplotlib.collections import Collection, LineCollection, PolyCollection
+from matplotlib.text import Text
+from matplotlib.transforms import Bbox
+from contextlib import ExitStack, contextmanager
+import argparse
+import bisect
+import collections
+import functools
+import glob
+import hashlib
+import itertools
+import json
+import multiprocessing
+import operator
+import os
+import re
+import subprocess
+import time
+import warnings
 import numpy as np
-
-# Register Work Sans fonts from the actual app
-_font_dir = '/Users/davidingraham/hyperperfect7/static'
-for weight in ['400', '500', '600', '700']:
-    font_manager.fontManager.addfont(f'{_font_dir}/work-sans-{weight}.ttf')
-
-# Load paperclip icon
-PAPERCLIP_IMG = plt.imread('paperclip.png')
+import PIL
+from PIL import GifImagePlugin, Image, ImageDraw, ImageFont
+
+# --- Assets ---
+# Nothing is loaded at import: fonts are registered and icons decoded the
+# first time something is drawn, and cached from then on.
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+# Work Sans TTFs from the actual app. Checked in order: $HYPERPERFECT_FONT_DIR,
+# fonts/ next to this script, then the original checkout location.
+FONT_DIRS = [os.environ.get('HYPERPERFECT_FONT_DIR'), os.path.join(ASSET_DIR, 'fonts'),
+             '/Users/davidingraham/hyperperfect7/static']
+FONT_WEIGHTS = ['400', '500', '600', '700']
+
+@functools.lru_cache(maxsize=None)
+def register_fonts():
+    """Register the Work Sans weights with matplotlib once; returns the font files used"""
+    for font_dir in filter(None, FONT_DIRS):
+        paths = [os.path.join(font_dir, f'work-sans-{weight}.ttf') for weight in FONT_WEIGHTS]
+        if all(os.path.exists(path) for path in paths):
+            for path in paths:
+                font_manager.fontManager.addfont(path)
+            return tuple(paths)
+    warnings.warn("Work Sans fonts not found; set HYPERPERFECT_FONT_DIR. Falling back to the default font.")
+    return ()
+
+@functools.lru_cache(maxsize=None)
+def load_image(name):
+    """Decode an image next to this script once"""
+    return plt.imread(os.path.join(ASSET_DIR, name))
+
+@functools.lru_cache(maxsize=None)
+def load_sprite(name, scale):
+    """RGBA uint8 pixels of an image resized by `scale`, resampled once with Pillow"""
+    img = Image.fromarray((load_image(name) * 255).round().astype(np.uint8))
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return np.array(img.resize(size, Image.LANCZOS))
 
 # --- Design System Colors (from HyperPerfect app) ---
 COLOR_TEXT_PRIMARY = '#374151'
@@ -26,15 +74,25 @@ COLOR_BORDER = '#e2e5eb'
 COLOR_BORDER_LIGHT = '#eceef2'
 FONT_FAMILY = 'Work Sans'
 
-# Setup the figure and axis
-# 1200x600 pixels (8x4 inches at 75 DPI) - optimized for email
-fig, ax = plt.subplots(figsize=(8, 4), dpi=150)
-fig.patch.set_facecolor('#ffffff')
-# Remove all margins/padding around the plot
-fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
-ax.set_xlim(0, 1400)
-ax.set_ylim(0, 700)
-ax.axis('off')
+# Figure resolution, read when the figure is created
+DPI = 150
+# Figure size in inches, and the data coordinates it spans
+FIGSIZE = (8, 4)
+VIEW_W, VIEW_H = 1400, 700
+
+def make_axes():
+    """Create a figure and axis with a transparent background, one per layer"""
+    register_fonts()
+    # 1200x600 pixels (8x4 inches at 75 DPI) - optimized for email
+    fig, ax = plt.subplots(figsize=FIGSIZE, dpi=DPI)
+    # Layers are composited over the page color, see LayeredScene
+    fig.patch.set_facecolor('none')
+    # Remove all margins/padding around the plot
+    fig.subplots_adjust(left=0, right=1, top=1, bottom=0)
+    ax.set_xlim(0, VIEW_W)
+    ax.set_ylim(0, VIEW_H)
+    ax.axis('off')
+    return ax
 
 # --- Design Constants ---
 excel_x, excel_y, excel_w, excel_h = 10, 40, 710, 620
@@ -42,94 +100,1241 @@ chat_x, chat_y, chat_w, chat_h = 750, 40, 630, 620
 header_h = 50
 input_h = 60
 
-# --- Helper Functions ---
+# --- Retained Scene Graph ---
+
+DIRTY_PAD = 4  # pixels added around each changed artist's extent
+
+def _prop_changed(old, new):
+    if old is new:
+        return False
+    if isinstance(old, np.ndarray) or isinstance(new, np.ndarray):
+        return not np.array_equal(old, new)
+    return old != new
+
+def _rects_overlap(extent, rects):
+    r0, c0, r1, c1 = extent
+    return any(r0 < b1 and b0 < r1 and c0 < d1 and d0 < c1 for b0, d0, b1, d1 in rects)
+
+def _bounding_rect(rects):
+    """Smallest (row0, col0, row1, col1) rectangle containing all `rects`, or None"""
+    rects = list(rects)
+    if not rects:
+        return None
+    r0, c0, r1, c1 = zip(*rects)
+    return min(r0), min(c0), max(r1), max(c1)
+
+class Sprite(Artist):
+    """Pre-scaled RGBA pixels composited into the canvas, centered on `xy`
+
+    The pixels are drawn 1:1 at a whole-pixel offset, so nothing is resampled
+    when the frame is rendered.
+    """
+
+    def __init__(self, pixels, xy, **kwargs):
+        super().__init__()
+        self._pixels = pixels
+        self._xy = xy
+        self.set(**kwargs)
+
+    def set_pixels(self, pixels):
+        self._pixels = pixels
+        self.stale = True
+
+    def set_xy(self, xy):
+        self._xy = xy
+        self.stale = True
+
+    def _origin(self):
+        x, y = self.get_transform().transform(self._xy)
+        height, width = self._pixels.shape[:2]
+        return round(x - width / 2), round(y - height / 2)
+
+    def get_window_extent(self, renderer=None):
+        x0, y0 = self._origin()
+        height, width = self._pixels.shape[:2]
+        return Bbox.from_bounds(x0, y0, width, height)
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        gc = renderer.new_gc()
+        gc.set_alpha(self.get_alpha())
+        # draw_image takes rows bottom to top
+        renderer.draw_image(gc, *self._origin(), self._pixels[::-1])
+        gc.restore()
+        self.stale = False
+
+
+class Scene:
+    """Persistent artists for every UI element, keyed by a stable id.
+
+    Draw helpers describe a frame by calling the primitives below with a key.
+    The artist behind a key is created the first time it is needed and after
+    that only has its visibility, text, geometry or colors updated. Anything
+    not touched between begin_frame() and end_frame() is hidden, so a frame
+    costs what changed rather than the total number of elements.
+
+    render() rasterizes the frame. Elements created inside ``with
+    scene.static():`` (layout chrome, grid, headers) are cached once as a
+    background raster; later frames only restore and redraw the pixel
+    rectangles covered by elements that changed.
+    """
+
+    backend = 'agg'
+
+    def __init__(self, ax, blit=True):
+        # An Axes, or a function returning one that is called on first use
+        self._ax = ax
+        self.blit = blit
+        self._artists = {}
+        self._props = {}
+        self._touched = set()
+        self._static_keys = set()
+        self._creating_static = False
+        self._dirty = set()
+        self._extents = {}
+        self._draw_order = None
+        self._prefix_len = 0
+        self._background = None
+        # Buffer rectangles repainted by the last render()
+        self.damage = []
+
+    @property
+    def ax(self):
+        if callable(self._ax):
+            self._ax = self._ax()
+        return self._ax
+
+    @property
+    def artist_count(self):
+        return len(self._artists)
+
+    @property
+    def changed(self):
+        """Whether render() has anything to repaint"""
+        return bool(self._dirty) or not self.blit or self._background is None
+
+    @property
+    def bounds(self):
+        """Buffer rectangle containing everything drawn in the last frame, or None"""
+        return _bounding_rect(self._extents.values())
+
+    @property
+    def dpi(self):
+        return self.ax.figure.dpi
+
+    @property
+    def size(self):
+        """(width, height) of the frame in pixels"""
+        return self.ax.figure.canvas.get_width_height()
+
+    def measure(self, text, fontsize, family, fontweight='normal'):
+        """(width, height, descent) of `text` in pixels, from the renderer's font metrics"""
+        prop = font_manager.FontProperties(family=list(family), size=fontsize, weight=fontweight)
+        return self.ax.figure.canvas.get_renderer().get_text_width_height_descent(text, prop, ismath=False)
+
+    def begin_frame(self):
+        self._touched = set()
+
+    def end_frame(self):
+        for key, artist in self._artists.items():
+            if key not in self._touched and artist.get_visible():
+                artist.set_visible(False)
+                self._dirty.add(key)
+
+    def keep(self, *keys):
+        """Carry elements over from the last frame as they were, without restating them
+
+        Returns False, keeping nothing, unless all of them were drawn last frame.
+        """
+        if not all(key in self._artists and self._artists[key].get_visible() for key in keys):
+            return False
+        self._touched.update(keys)
+        return True
+
+    @contextmanager
+    def static(self):
+        """Mark elements created in this block as part of the cached background"""
+        self._creating_static = True
+        try:
+            yield
+        finally:
+            self._creating_static = False
+
+    def _element(self, key, create, props):
+        self._touched.add(key)
+        artist = self._artists.get(key)
+        if artist is None:
+            artist = create()
+            self._artists[key] = artist
+            self._props[key] = props
+            self._dirty.add(key)
+            self._draw_order = None
+            if self._creating_static:
+                self._static_keys.add(key)
+            return artist
+        old = self._props[key]
+        changed = {k: v for k, v in props.items() if _prop_changed(old.get(k), v)}
+        if changed:
+            artist.set(**changed)
+            self._props[key] = props
+            self._dirty.add(key)
+            if 'zorder' in changed:
+                self._draw_order = None
+        if not artist.get_visible():
+            artist.set_visible(True)
+            self._dirty.add(key)
+        return artist
+
+    def render(self):
+        """Rasterize the current frame and return it as an (H, W, 4) RGBA view of the canvas"""
+        canvas = self.ax.figure.canvas
+        if self._draw_order is None:
+            self._update_draw_order()
+        if not self.blit or self._background is None or self._dirty & self._static_keys:
+            return self._render_full()
+
+        renderer = canvas.get_renderer()
+        rects = []
+        for key in self._dirty:
+            old = self._extents.pop(key, None)
+            if old is not None:
+                rects.append(old)
+            artist = self._artists[key]
+            if artist.get_visible():
+                self._extents[key] = self._pixel_extent(artist, renderer)
+                rects.append(self._extents[key])
+        self._dirty.clear()
+        self.damage = rects
+
+        frame = np.asarray(renderer.buffer_rgba())
+        if not rects:
+            return frame
+        # Artists overlapping a dirty rect are redrawn whole; pixels outside
+        # the dirty rects are put back from the previous frame afterwards.
+        previous = frame.copy()
+        for r0, c0, r1, c1 in rects:
+            frame[r0:r1, c0:c1] = self._background[r0:r1, c0:c1]
+        for key in self._draw_order[self._prefix_len:]:
+            extent = self._extents.get(key)
+            if extent is not None and self._artists[key].get_visible() and _rects_overlap(extent, rects):
+                self._artists[key].draw(renderer)
+        for r0, c0, r1, c1 in rects:
+            previous[r0:r1, c0:c1] = frame[r0:r1, c0:c1]
+        frame[:] = previous
+        return frame
+
+    def _update_draw_order(self):
+        # Same order Axes.draw uses: stable sort of creation order by zorder
+        order = sorted(self._artists, key=lambda k: self._artists[k].get_zorder())
+        prefix_len = 0
+        for key in order:
+            if key not in self._static_keys:
+                break
+            prefix_len += 1
+        if prefix_len != self._prefix_len:
+            self._background = None
+        self._draw_order = order
+        self._prefix_len = prefix_len
+
+    def _render_full(self):
+        canvas = self.ax.figure.canvas
+        if self.blit:
+            # Background = the leading static artists, drawn before any dynamic one
+            foreground = [self._artists[k] for k in self._draw_order[self._prefix_len:]]
+            visible = [a.get_visible() for a in foreground]
+            for artist in foreground:
+                artist.set_visible(False)
+            canvas.draw()
+            self._background = np.asarray(canvas.buffer_rgba()).copy()
+            for artist, was_visible in zip(foreground, visible):
+                artist.set_visible(was_visible)
+        canvas.draw()
+        renderer = canvas.get_renderer()
+        previous = list(self._extents.values())
+        self._extents = {key: self._pixel_extent(artist, renderer)
+                         for key, artist in self._artists.items() if artist.get_visible()}
+        self._dirty.clear()
+        # Nothing outside the old and new artists' extents can have changed
+        box = _bounding_rect(previous + list(self._extents.values()))
+        self.damage = [box] if box else []
+        return np.asarray(renderer.buffer_rgba())
+
+    def _pixel_extent(self, artist, renderer):
+        """(row0, col0, row1, col1) buffer rectangle covered by an artist"""
+        if isinstance(artist, Collection):
+            bbox = artist.get_datalim(self.ax.transData).transformed(self.ax.transData)
+        else:
+            bbox = artist.get_window_extent(renderer)
+        if isinstance(artist, Text) and artist.get_bbox_patch() is not None:
+            artist.update_bbox_position_size(renderer)
+            bbox = Bbox.union([bbox, artist.get_bbox_patch().get_window_extent(renderer)])
+        height, width = renderer.height, renderer.width
+        # Pad for antialiasing and half the stroke width of outlined patches
+        c0 = min(max(int(np.floor(bbox.x0)) - DIRTY_PAD, 0), width)
+        c1 = min(max(int(np.ceil(bbox.x1)) + DIRTY_PAD, 0), width)
+        r0 = min(max(int(np.floor(height - bbox.y1)) - DIRTY_PAD, 0), height)
+        r1 = min(max(int(np.ceil(height - bbox.y0)) + DIRTY_PAD, 0), height)
+        return (r0, c0, r1, c1)
+
+    def rect(self, key, x, y, w, h, **style):
+        def create():
+            return self.ax.add_patch(patches.Rectangle((x, y), w, h, **style))
+        return self._element(key, create, dict(xy=(x, y), width=w, height=h, **style))
+
+    def rounded_rect(self, key, x, y, w, h, r, **style):
+        boxstyle = f"round,pad=0,rounding_size={r}"
+        def create():
+            return self.ax.add_patch(patches.FancyBboxPatch((x, y), w, h, boxstyle=boxstyle, **style))
+        return self._element(key, create, dict(x=x, y=y, width=w, height=h, boxstyle=boxstyle, **style))
+
+    def circle(self, key, xy, radius, **style):
+        def create():
+            return self.ax.add_patch(patches.Circle(xy, radius, **style))
+        return self._element(key, create, dict(center=xy, radius=radius, **style))
+
+    def polygon(self, key, xy, **style):
+        def create():
+            return self.ax.add_patch(patches.Polygon(xy, **style))
+        return self._element(key, create, dict(xy=xy, **style))
+
+    def line(self, key, xs, ys, **style):
+        def create():
+            return self.ax.plot(xs, ys, **style)[0]
+        return self._element(key, create, dict(xdata=xs, ydata=ys, **style))
+
+    def lines(self, key, segments, **style):
+        """Many line segments, an (N, 2, 2) array, drawn as one LineCollection"""
+        # Match Line2D's default cap style so segments end where ax.plot lines did
+        style.setdefault('capstyle', mpl.rcParams['lines.solid_capstyle'])
+        def create():
+            return self.ax.add_collection(LineCollection(segments, **style), autolim=False)
+        return self._element(key, create, dict(segments=segments, **style))
+
+    def polygons(self, key, verts, **style):
+        """Many closed polygons, an (N, M, 2) array, drawn as one PolyCollection"""
+        # Match the miter joins of individual patches
+        style.setdefault('joinstyle', 'miter')
+        def create():
+            return self.ax.add_collection(PolyCollection(verts, **style), autolim=False)
+        return self._element(key, create, dict(verts=verts, **style))
+
+    def text(self, key, x, y, s, **style):
+        def create():
+            return self.ax.text(x, y, s, **style)
+        return self._element(key, create, dict(x=x, y=y, text=s, **style))
+
+    def image(self, key, name, xy, zoom, zorder=1):
+        """Icon `name` centered on `xy`, `zoom` pixels per point like OffsetImage"""
+        pixels = load_sprite(name, zoom * self.dpi / 72)
+        def create():
+            return self.ax.add_artist(Sprite(pixels, xy, zorder=zorder))
+        return self._element(key, create, dict(pixels=pixels, xy=xy, zorder=zorder))
+
+
+# --- Raster Backend ---
+# The same primitives drawn straight into a NumPy RGBA buffer, without
+# matplotlib's artists and Agg: shapes are rasterized from signed distance
+# fields with box-filter antialiasing and text with Pillow's FreeType
+# bindings. matplotlib is only used to parse colors and find font files.
+
+def _color(color, alpha=None):
+    """(opaque RGBA in 0-255 as a (4, 1, 1) array, opacity) of a matplotlib color, or None when nothing is drawn"""
+    if color is None or (isinstance(color, str) and color.lower() == 'none'):
+        return None
+    r, g, b, a = mpl.colors.to_rgba(color, alpha)
+    if a == 0:
+        return None
+    return np.array([r, g, b, 1], np.float32).reshape(4, 1, 1) * 255, a
+
+def _coverage(distance):
+    """Fraction of each pixel inside a shape, from the signed distance of its center to the edge"""
+    return np.clip(0.5 - distance, 0, 1)
+
+def _grid(x0, y0, x1, y1):
+    """Pixel centers of the window around a bounding box in buffer coordinates"""
+    c0, r0 = int(np.floor(x0)) - 1, int(np.floor(y0)) - 1
+    c1, r1 = int(np.ceil(x1)) + 1, int(np.ceil(y1)) + 1
+    xs = np.arange(c0, c1, dtype=np.float32) + 0.5
+    ys = np.arange(r0, r1, dtype=np.float32)[:, None] + 0.5
+    return (r0, c0), xs, ys
+
+def _unpremultiply(planes):
+    """(H, W, 4) straight-alpha pixels, as Agg stores them, from (4, H, W) premultiplied planes"""
+    rgb = planes[:3] * (255 / np.maximum(planes[3], 1))
+    return np.concatenate([rgb, planes[3:]]).transpose(1, 2, 0)
+
+def _run(mask, index):
+    """[start, stop) of the run of True in `mask` around `index`"""
+    if not mask[index]:
+        return index, index
+    breaks = np.flatnonzero(~mask)
+    before, after = breaks[breaks < index], breaks[breaks > index]
+    return (before[-1] + 1 if len(before) else 0), (after[0] if len(after) else len(mask))
+
+def _layers(r0, c0, alpha, rgb):
+    """Split a layer of one color into an opaque core and the edges around it
+
+    Layers are (row, col, alpha, color, opaque). A shape's interior is either
+    fully covered (a fill) or not at all (inside a stroke), so the rectangle
+    of constant coverage around its center is assigned or skipped instead of
+    blended, and only the antialiased edges are blended per pixel.
+    """
+    height, width = alpha.shape
+    for value in (1, 0):
+        same = alpha == value
+        ra, rb = _run(same[:, width // 2], height // 2)
+        if rb - ra < 3:
+            continue
+        ca, cb = _run(same[ra:rb].all(axis=0), width // 2)
+        if cb - ca < 3:
+            continue
+        edges = [(r0, c0, alpha[:ra]), (r0 + rb, c0, alpha[rb:]),
+                 (r0 + ra, c0, alpha[ra:rb, :ca]), (r0 + ra, c0 + cb, alpha[ra:rb, cb:])]
+        layers = [(row, col, edge, rgb, False) for row, col, edge in edges if edge.any()]
+        if value:
+            layers.append((r0 + ra, c0 + ca, np.broadcast_to(np.float32(1), (rb - ra, cb - ca)), rgb, True))
+        return layers
+    return [(r0, c0, alpha, rgb, False)] if alpha.any() else []
+
+def _snap(points, linewidth):
+    """Snap a rectilinear outline to the pixel grid the way Agg does
+
+    Vertices go to pixel boundaries, or to pixel centers when the rounded
+    stroke width is odd, so 1px lines stay crisp. Outlines with diagonal or
+    curved edges are left as they are.
+    """
+    steps = np.abs(np.diff(points, axis=0, append=points[:1]))
+    if not (steps.min(axis=1) < 1e-4).all():
+        return points
+    return np.floor(points + 0.5) + (0.5 if int(linewidth + 0.5) % 2 else 0.0)
+
+def _polygon_distance(points, xs, ys):
+    """Signed distance to a convex polygon: the largest distance outside any of its edges"""
+    points = points[np.abs(np.diff(points, axis=0, append=points[:1])).sum(axis=1) > 0]
+    x, y = points[:, 0], points[:, 1]
+    # Orient the edges so (dy, -dx) points outwards
+    if np.dot(x, np.roll(y, -1)) < np.dot(np.roll(x, -1), y):
+        points = points[::-1]
+    distance = None
+    for (ax0, ay0), (ax1, ay1) in zip(points, np.roll(points, -1, axis=0)):
+        nx, ny = ay1 - ay0, ax0 - ax1
+        norm = np.hypot(nx, ny)
+        edge = ((xs - ax0) * nx + (ys - ay0) * ny) / norm
+        distance = edge if distance is None else np.maximum(distance, edge)
+    return distance
+
+def _rounded_box_distance(x0, y0, x1, y1, radius, xs, ys):
+    hx, hy = (x1 - x0) / 2, (y1 - y0) / 2
+    radius = min(radius, hx, hy)
+    qx = np.abs(xs - (x0 + hx)) - (hx - radius)
+    qy = np.abs(ys - (y0 + hy)) - (hy - radius)
+    outside = np.hypot(np.maximum(qx, 0), np.maximum(qy, 0))
+    return outside + np.minimum(np.maximum(qx, qy), 0) - radius
+
+def _shape_layers(origin, distance, face, edge, linewidth):
+    """Fill and stroke layers of a shape; the stroke is centered on its outline"""
+    layers = []
+    if face is not None:
+        rgb, opacity = face
+        layers += _layers(*origin, _coverage(distance) * opacity, rgb)
+    if edge is not None and linewidth > 0:
+        rgb, opacity = edge
+        half = linewidth / 2
+        layers += _layers(*origin, (_coverage(distance - half) - _coverage(distance + half)) * opacity, rgb)
+    return layers
+
+@functools.lru_cache(maxsize=None)
+def raster_font(family, size, weight='normal', style='normal'):
+    """Pillow font for a matplotlib font spec, `size` in pixels, from the file matplotlib would use"""
+    register_fonts()
+    prop = font_manager.FontProperties(family=list(family), weight=weight, style=style)
+    return ImageFont.truetype(font_manager.findfont(prop), size)
+
+class RasterScene:
+    """Scene's primitives composited with NumPy into a preallocated frame buffer
+
+    Keys, styles, z-order, static() and render() behave as in Scene, and
+    frames are the same (H, W, 4) RGBA buffer: straight alpha, transparent
+    where nothing is drawn. Pixels are blended as premultiplied (4, H, W)
+    float planes, so colors are blended like coverage. Each element is rasterized into
+    coverage layers once, when it is created or its properties change; a
+    frame only composites the elements overlapping pixels that changed onto
+    the cached background. Geometry follows Agg: rectilinear outlines snap to
+    the pixel grid, strokes are centered on the outline and line ends project
+    by half the line width.
+    """
+
+    backend = 'raster'
+
+    def __init__(self, blit=True):
+        self.blit = blit
+        self._dpi = None
+        self._props = {}
+        self._zorders = {}
+        self._rasterizers = {}
+        self._layers = {}
+        self._visible = set()
+        self._touched = set()
+        self._static_keys = set()
+        self._creating_static = False
+        self._dirty = set()
+        self._extents = {}
+        self._draw_order = None
+        self._prefix_len = 0
+        self._background = None
+        self._frame = None
+        self.damage = []
+
+    @property
+    def artist_count(self):
+        return len(self._props)
+
+    @property
+    def changed(self):
+        """Whether render() has anything to repaint"""
+        return bool(self._dirty) or not self.blit or self._background is None
+
+    @property
+    def bounds(self):
+        """Buffer rectangle containing everything drawn in the last frame, or None"""
+        return _bounding_rect(self._extents.values())
+
+    @property
+    def dpi(self):
+        # Read on first use, like the figure's
+        if self._dpi is None:
+            self._dpi = DPI
+        return self._dpi
+
+    @property
+    def size(self):
+        """(width, height) of the frame in pixels"""
+        return int(FIGSIZE[0] * self.dpi), int(FIGSIZE[1] * self.dpi)
+
+    def measure(self, text, fontsize, family, fontweight='normal', style='normal'):
+        """(width, height, descent) of `text` in pixels, from the FreeType metrics Pillow draws with"""
+        font = raster_font(family, fontsize * self.dpi / 72, fontweight, style)
+        _, top, _, bottom = font.getbbox(text, anchor='ls')
+        return font.getlength(text), bottom - top, max(bottom, 0)
+
+    def begin_frame(self):
+        self._touched = set()
+
+    def end_frame(self):
+        hidden = self._visible - self._touched
+        self._visible -= hidden
+        self._dirty |= hidden
+
+    def keep(self, *keys):
+        """Carry elements over from the last frame as they were, without restating them
+
+        Returns False, keeping nothing, unless all of them were drawn last frame.
+        """
+        if not self._visible.issuperset(keys):
+            return False
+        self._touched.update(keys)
+        return True
+
+    @contextmanager
+    def static(self):
+        """Mark elements created in this block as part of the cached background"""
+        self._creating_static = True
+        try:
+            yield
+        finally:
+            self._creating_static = False
+
+    def _element(self, key, rasterize, props, zorder):
+        self._touched.add(key)
+        old = self._props.get(key)
+        if old is None:
+            self._draw_order = None
+            if self._creating_static:
+                self._static_keys.add(key)
+        elif not any(_prop_changed(old.get(k), v) for k, v in props.items()):
+            if key not in self._visible:
+                self._visible.add(key)
+                self._dirty.add(key)
+            return
+        elif zorder != self._zorders[key]:
+            self._draw_order = None
+        self._props[key] = props
+        self._zorders[key] = zorder
+        self._rasterizers[key] = rasterize
+        self._layers.pop(key, None)
+        self._visible.add(key)
+        self._dirty.add(key)
+
+    def render(self):
+        """Composite the current frame and return it as an (H, W, 4) RGBA view of the buffer"""
+        if self._frame is None:
+            width, height = self.size
+            self._frame = np.zeros((height, width, 4), np.uint8)
+        if self._draw_order is None:
+            self._update_draw_order()
+        if not self.blit or self._background is None or self._dirty & self._static_keys:
+            return self._render_full()
+
+        rects = []
+        for key in self._dirty:
+            old = self._extents.pop(key, None)
+            if old is not None:
+                rects.append(old)
+            if key in self._visible and (extent := self._extent(key)) is not None:
+                self._extents[key] = extent
+                rects.append(extent)
+        self._dirty.clear()
+        self.damage = rects
+
+        foreground = [key for key in self._draw_order[self._prefix_len:] if key in self._extents]
+        for rect in rects:
+            r0, c0, r1, c1 = rect
+            region = self._background[:, r0:r1, c0:c1].copy()
+            for key in foreground:
+                if _rects_overlap(self._extents[key], [rect]):
+                    self._composite(key, region, rect)
+            self._frame[r0:r1, c0:c1] = _unpremultiply(region) + 0.5
+        return self._frame
+
+    def _update_draw_order(self):
+        # Stable sort of creation order by zorder, as in Scene
+        order = sorted(self._props, key=self._zorders.get)
+        prefix_len = 0
+        for key in order:
+            if key not in self._static_keys:
+                break
+            prefix_len += 1
+        if prefix_len != self._prefix_len:
+            self._background = None
+        self._draw_order = order
+        self._prefix_len = prefix_len
+
+    def _render_full(self):
+        # Only the rectangle around the old and new elements is composited;
+        # the buffer is transparent everywhere else
+        previous = list(self._extents.values())
+        self._extents = {key: extent for key in self._draw_order
+                         if key in self._visible and (extent := self._extent(key)) is not None}
+        self._dirty.clear()
+        box = _bounding_rect(previous + list(self._extents.values()))
+        self.damage = [box] if box else []
+        self._background = np.zeros((4, *self._frame.shape[:2]), np.float32) if self.blit else None
+        if box is None:
+            return self._frame
+
+        r0, c0, r1, c1 = box
+        canvas = np.zeros((4, r1 - r0, c1 - c0), np.float32)
+        for index, key in enumerate(self._draw_order):
+            if index == self._prefix_len and self.blit:
+                self._background[:, r0:r1, c0:c1] = canvas
+            if key in self._extents:
+                self._composite(key, canvas, box)
+        if self._prefix_len == len(self._draw_order) and self.blit:
+            self._background[:, r0:r1, c0:c1] = canvas
+        self._frame[r0:r1, c0:c1] = _unpremultiply(canvas) + 0.5
+        return self._frame
+
+    def _extent(self, key):
+        """(row0, col0, row1, col1) buffer rectangle covered by an element, or None if it draws nothing"""
+        layers = self._layers.get(key)
+        if layers is None:
+            layers = self._layers[key] = self._rasterizers[key]()
+        height, width = self._frame.shape[:2]
+        r0 = c0 = r1 = c1 = None
+        for lr0, lc0, alpha, *_ in layers:
+            lr1, lc1 = lr0 + alpha.shape[0], lc0 + alpha.shape[1]
+            r0, c0 = lr0 if r0 is None else min(r0, lr0), lc0 if c0 is None else min(c0, lc0)
+            r1, c1 = lr1 if r1 is None else max(r1, lr1), lc1 if c1 is None else max(c1, lc1)
+        if r0 is None:
+            return None
+        r0, c0, r1, c1 = max(r0, 0), max(c0, 0), min(r1, height), min(c1, width)
+        return (r0, c0, r1, c1) if r0 < r1 and c0 < c1 else None
+
+    def _composite(self, key, region, rect):
+        """Blend an element's layers into `region`, the (4, H, W) premultiplied planes of buffer rectangle `rect`"""
+        R0, C0, R1, C1 = rect
+        for r0, c0, alpha, rgb, opaque in self._layers[key]:
+            a0, b0 = max(r0, R0), max(c0, C0)
+            a1, b1 = min(r0 + alpha.shape[0], R1), min(c0 + alpha.shape[1], C1)
+            if a0 >= a1 or b0 >= b1:
+                continue
+            dst = region[:, a0 - R0:a1 - R0, b0 - C0:b1 - C0]
+            if opaque:
+                dst[:] = rgb
+                continue
+            if rgb.size > 4:
+                rgb = rgb[:, a0 - r0:a1 - r0, b0 - c0:b1 - c0]
+            dst += (rgb - dst) * alpha[a0 - r0:a1 - r0, b0 - c0:b1 - c0]
+
+    def _to_pixels(self, points):
+        """Data coordinates to buffer coordinates (x right, y down, in pixels)"""
+        width, height = self.size
+        points = np.asarray(points, np.float64)
+        return np.stack([points[..., 0] * width / VIEW_W, height - points[..., 1] * height / VIEW_H], axis=-1)
+
+    def _patch_style(self, style):
+        """Fill, edge and stroke width in pixels, with matplotlib's patch defaults"""
+        alpha = style.get('alpha')
+        face = _color(style.get('facecolor', style.get('color', mpl.rcParams['patch.facecolor'])), alpha)
+        edge = _color(style.get('edgecolor', style.get('color', 'none')), alpha)
+        linewidth = style.get('linewidth', mpl.rcParams['patch.linewidth']) * self.dpi / 72
+        # Like Agg, nothing is stroked (or snapped for a stroke) without a visible edge
+        return face, edge, linewidth if edge is not None else 0
+
+    def _polygon_layers(self, points, style):
+        """Layers of a convex polygon given in buffer coordinates"""
+        face, edge, linewidth = self._patch_style(style)
+        points = _snap(np.asarray(points, np.float64), linewidth)
+        (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+        pad = linewidth / 2
+        origin, xs, ys = _grid(x0 - pad, y0 - pad, x1 + pad, y1 + pad)
+        return _shape_layers(origin, _polygon_distance(points, xs, ys), face, edge, linewidth)
+
+    def _segment_layers(self, segments, style, default_width):
+        color = _color(style.get('color', mpl.rcParams['lines.color']), style.get('alpha'))
+        if color is None:
+            return []
+        linewidth = style.get('linewidth', default_width) * self.dpi / 72
+        half = linewidth / 2
+        cap = half if style.get('capstyle', mpl.rcParams['lines.solid_capstyle']) == 'projecting' else 0
+        layers = []
+        for segment in segments:
+            (ax0, ay0), (ax1, ay1) = _snap(self._to_pixels(segment), linewidth)
+            length = np.hypot(ax1 - ax0, ay1 - ay0)
+            if length == 0:
+                continue
+            ux, uy = (ax1 - ax0) / length, (ay1 - ay0) / length
+            # The stroke is the rectangle around the segment, extended by the caps
+            ends = np.array([[ax0 - ux * cap, ay0 - uy * cap], [ax1 + ux * cap, ay1 + uy * cap]])
+            side = np.array([-uy * half, ux * half])
+            corners = np.array([ends[0] + side, ends[1] + side, ends[1] - side, ends[0] - side])
+            (x0, y0), (x1, y1) = corners.min(axis=0), corners.max(axis=0)
+            origin, xs, ys = _grid(x0, y0, x1, y1)
+            layers += _shape_layers(origin, _polygon_distance(corners, xs, ys), color, None, 0)
+        return layers
+
+    def rect(self, key, x, y, w, h, **style):
+        def rasterize():
+            return self._polygon_layers(self._to_pixels([(x, y), (x + w, y), (x + w, y + h), (x, y + h)]), style)
+        return self._element(key, rasterize, dict(xy=(x, y), width=w, height=h, **style), style.get('zorder', 1))
+
+    def rounded_rect(self, key, x, y, w, h, r, **style):
+        def rasterize():
+            face, edge, linewidth = self._patch_style(style)
+            (x0, y1), (x1, y0) = self._to_pixels([(x, y), (x + w, y + h)])
+            pad = linewidth / 2
+            origin, xs, ys = _grid(x0 - pad, y0 - pad, x1 + pad, y1 + pad)
+            radius = r * (x1 - x0) / w
+            return _shape_layers(origin, _rounded_box_distance(x0, y0, x1, y1, radius, xs, ys), face, edge, linewidth)
+        return self._element(key, rasterize, dict(x=x, y=y, width=w, height=h, radius=r, **style), style.get('zorder', 1))
+
+    def circle(self, key, xy, radius, **style):
+        def rasterize():
+            face, edge, linewidth = self._patch_style(style)
+            cx, cy = self._to_pixels(xy)
+            extent = radius * self.size[0] / VIEW_W + linewidth / 2
+            origin, xs, ys = _grid(cx - extent, cy - extent, cx + extent, cy + extent)
+            distance = np.hypot(xs - cx, ys - cy) - radius * self.size[0] / VIEW_W
+            return _shape_layers(origin, distance, face, edge, linewidth)
+        return self._element(key, rasterize, dict(center=xy, radius=radius, **style), style.get('zorder', 1))
+
+    def polygon(self, key, xy, **style):
+        """A convex polygon"""
+        def rasterize():
+            return self._polygon_layers(self._to_pixels(xy), style)
+        return self._element(key, rasterize, dict(xy=xy, **style), style.get('zorder', 1))
+
+    def line(self, key, xs, ys, **style):
+        def rasterize():
+            points = np.stack([xs, ys], axis=-1)
+            segments = np.stack([points[:-1], points[1:]], axis=1)
+            return self._segment_layers(segments, style, mpl.rcParams['lines.linewidth'])
+        return self._element(key, rasterize, dict(xdata=xs, ydata=ys, **style), style.get('zorder', 2))
+
+    def lines(self, key, segments, **style):
+        """Many line segments, an (N, 2, 2) array"""
+        def rasterize():
+            return self._segment_layers(segments, style, mpl.rcParams['lines.linewidth'])
+        return self._element(key, rasterize, dict(segments=segments, **style), style.get('zorder', 2))
+
+    def polygons(self, key, verts, **style):
+        """Many closed convex polygons, an (N, M, 2) array"""
+        def rasterize():
+            return [layer for points in self._to_pixels(verts) for layer in self._polygon_layers(points, style)]
+        return self._element(key, rasterize, dict(verts=verts, **style), style.get('zorder', 1))
+
+    def text(self, key, x, y, s, **style):
+        def rasterize():
+            return self._text_layers(x, y, s, style)
+        return self._element(key, rasterize, dict(x=x, y=y, text=s, **style), style.get('zorder', 3))
+
+    def _text_layers(self, x, y, s, style):
+        family = style.get('fontfamily', mpl.rcParams['font.family'])
+        family = tuple(family) if isinstance(family, (list, tuple)) else (family,)
+        font = (style.get('fontsize', mpl.rcParams['font.size']), family,
+                style.get('fontweight', 'normal'), style.get('style', 'normal'))
+        # Line box as matplotlib lays it out: never shorter than "lp"
+        width, height, descent = self.measure(s, *font)
+        _, lp_height, lp_descent = self.measure('lp', *font)
+        height, descent = max(height, lp_height), max(descent, lp_descent)
+
+        px, py = self._to_pixels((x, y))
+        left = px - {'left': 0, 'center': width / 2, 'right': width}[style.get('ha', 'left')]
+        baseline = py + {'baseline': 0, 'top': height - descent, 'center': height / 2 - descent,
+                         'bottom': -descent}[style.get('va', 'baseline')]
+
+        layers = []
+        bbox = style.get('bbox')
+        if bbox is not None:
+            # The box around the line box, padded by a fraction of the font size
+            pad = re.search(r'pad=([\d.]+)', bbox.get('boxstyle', ''))
+            pad = (float(pad.group(1)) if pad else 0.3) * font[0] * self.dpi / 72
+            x0, y0 = left - pad, baseline + descent - height - pad
+            x1, y1 = left + width + pad, baseline + descent + pad
+            corners = [(x0, y0), (x1, y0), (x1, y1), (x0, y1)]
+            layers += self._polygon_layers(corners, {'facecolor': 'none', 'edgecolor': 'none', **bbox})
+
+        color = _color(style.get('color', mpl.rcParams['text.color']), style.get('alpha'))
+        if color is not None and s:
+            # Glyphs are rendered at their sub-pixel position
+            pil_font = raster_font(family, font[0] * self.dpi / 72, font[2], font[3])
+            l, t, r, b = pil_font.getbbox(s, anchor='ls')
+            c0, r0 = int(np.floor(left)) + l - 1, int(np.floor(baseline)) + t - 1
+            mask = Image.new('L', (r - l + 3, b - t + 3))
+            ImageDraw.Draw(mask).text((left - c0, baseline - r0), s, fill=255, font=pil_font, anchor='ls')
+            rgb, opacity = color
+            layers += _layers(r0, c0, np.asarray(mask, np.float32) * (opacity / 255), rgb)
+        return layers
+
+    def image(self, key, name, xy, zoom, zorder=1):
+        """Icon `name` centered on `xy`, `zoom` pixels per point like OffsetImage"""
+        pixels = load_sprite(name, zoom * self.dpi / 72)
+        def rasterize():
+            px, py = self._to_pixels(xy)
+            height, width = pixels.shape[:2]
+            # Whole-pixel origin, rounded in figure coordinates as Sprite does
+            c0 = round(px - width / 2)
+            r0 = self.size[1] - (round(self.size[1] - py - height / 2) + height)
+            color = np.concatenate([pixels[..., :3], np.full((height, width, 1), 255, np.uint8)], axis=2)
+            return [(r0, c0, pixels[..., 3] / np.float32(255), color.transpose(2, 0, 1).astype(np.float32), False)]
+        return self._element(key, rasterize, dict(pixels=pixels, xy=xy, zorder=zorder), zorder)
+
+
+# --- Layers ---
+# Bottom to top. The transient overlays are split so reference highlights
+# stay beneath the chat panel, which covers the right of the sheet, while the
+# input cursor sits above the input box.
+LAYERS = ['sheet', 'sheet_overlay', 'chrome', 'chat', 'chat_overlay']
+
+# Render backends selectable with --backend; each makes the scene for one layer
+BACKENDS = {
+    'agg': lambda: Scene(make_axes),
+    'raster': RasterScene,
+}
 
-def draw_rounded_rect(ax, x, y, w, h, r, color, ec=None, lw=1, zorder=1):
-    box = patches.FancyBboxPatch((x, y), w, h, boxstyle=f"round,pad=0,rounding_size={r}",
-                                 facecolor=color, edgecolor=ec if ec else "none", linewidth=lw, zorder=zorder)
-    ax.add_patch(box)
-    return box
+class LayeredScene:
+    """The frame as independently cached layers, composited with NumPy
+
+    Elements are drawn into the layer active at the time (see layer()). Each
+    layer is its own backend scene with its own transparent bitmap, so a
+    frame only re-rasterizes the layers whose elements changed, and only the
+    rectangles they repainted are composited again, over the page color.
+    Within a layer elements are ordered by zorder as before.
+    """
+
+    PRIMITIVES = ('rect', 'rounded_rect', 'circle', 'polygon', 'line', 'lines', 'polygons', 'text', 'image', 'keep')
+
+    def __init__(self, backend='agg', facecolor='#ffffff'):
+        self.backend = backend
+        self._facecolor = np.array(mpl.colors.to_rgb(facecolor), np.float32) * 255
+        self._blit = True
+        self._scenes = None
+        self._bitmaps = {}
+        self._current = LAYERS[0]
+        self._frame = None
+
+    @property
+    def layers(self):
+        """Each layer's scene by name, bottom to top, created on first use"""
+        if self._scenes is None:
+            self._scenes = {name: BACKENDS[self.backend]() for name in LAYERS}
+            for layer in self._scenes.values():
+                layer.blit = self._blit
+        return self._scenes
+
+    @property
+    def blit(self):
+        return self._blit
+
+    @blit.setter
+    def blit(self, blit):
+        self._blit = blit
+        for layer in (self._scenes or {}).values():
+            layer.blit = blit
+
+    @property
+    def artist_count(self):
+        return sum(layer.artist_count for layer in self.layers.values())
+
+    @property
+    def dpi(self):
+        return self.layers[LAYERS[0]].dpi
+
+    @property
+    def size(self):
+        """(width, height) of the frame in pixels"""
+        return self.layers[LAYERS[0]].size
+
+    def measure(self, text, fontsize, family, fontweight='normal'):
+        return self.layers[LAYERS[0]].measure(text, fontsize, family, fontweight)
+
+    def __getattr__(self, name):
+        # Primitives draw into the current layer
+        if name in LayeredScene.PRIMITIVES:
+            return getattr(self.layers[self._current], name)
+        raise AttributeError(name)
+
+    @contextmanager
+    def layer(self, name):
+        """Draw the elements created in this block into layer `name`"""
+        previous, self._current = self._current, name
+        try:
+            yield
+        finally:
+            self._current = previous
+
+    @contextmanager
+    def static(self):
+        """Mark elements created in this block, in any layer, as part of that layer's cached background"""
+        with ExitStack() as stack:
+            for layer in self.layers.values():
+                stack.enter_context(layer.static())
+            yield
+
+    def begin_frame(self):
+        for layer in self.layers.values():
+            layer.begin_frame()
+
+    def end_frame(self):
+        for layer in self.layers.values():
+            layer.end_frame()
+
+    def render(self):
+        """Re-rasterize the layers that changed and return the composited (H, W, 4) RGBA frame"""
+        damage = set()
+        for name, layer in self.layers.items():
+            if layer.changed:
+                self._bitmaps[name] = layer.render()
+                damage.update(layer.damage)
+        if self._frame is None:
+            width, height = self.size
+            self._frame = np.full((height, width, 4), 255, np.uint8)
+            damage = {(0, 0, height, width)}
+
+        # Each layer's bitmap is transparent outside its bounds
+        bitmaps = [(self._bitmaps[name], self.layers[name].bounds) for name in LAYERS if name in self._bitmaps]
+        for R0, C0, R1, C1 in damage:
+            region = np.empty((R1 - R0, C1 - C0, 3), np.float32)
+            region[:] = self._facecolor
+            for bitmap, bounds in bitmaps:
+                if bounds is None:
+                    continue
+                r0, c0 = max(R0, bounds[0]), max(C0, bounds[1])
+                r1, c1 = min(R1, bounds[2]), min(C1, bounds[3])
+                if r0 >= r1 or c0 >= c1:
+                    continue
+                # Layer bitmaps are straight alpha, like Agg's buffer
+                pixels = bitmap[r0:r1, c0:c1]
+                dst = region[r0 - R0:r1 - R0, c0 - C0:c1 - C0]
+                dst += (pixels[..., :3] - dst) * (pixels[..., 3:] / np.float32(255))
+            self._frame[R0:R1, C0:C1, :3] = region + 0.5
+        return self._frame
+
+
+class LayoutScene:
+    """Stands in for the scene to lay frames out without drawing them
+
+    Primitives draw nothing and keep() never holds an element over, so every
+    element is laid out and all the text a frame needs is measured. Metrics
+    come from a single layer of the named backend.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._measurer = BACKENDS[backend]()
+
+    @property
+    def dpi(self):
+        return self._measurer.dpi
+
+    @property
+    def size(self):
+        return self._measurer.size
+
+    def measure(self, text, fontsize, family, fontweight='normal'):
+        return self._measurer.measure(text, fontsize, family, fontweight)
+
+    def __getattr__(self, name):
+        if name in LayeredScene.PRIMITIVES:
+            return self._skip
+        raise AttributeError(name)
+
+    @staticmethod
+    def _skip(*args, **kwargs):
+        return False
+
+    @contextmanager
+    def layer(self, name):
+        yield
+
+    @contextmanager
+    def static(self):
+        yield
+
+    def begin_frame(self):
+        pass
+
+    def end_frame(self):
+        pass
+
+def use_backend(name):
+    """Draw with the named backend from now on; call before the first frame"""
+    global scene
+    scene = LayeredScene(name)
+    # Wrapped layouts hold the previous backend's widths
+    text_wrapper.cache_clear()
+    return scene
+
+scene = LayeredScene()
+
+# --- Text Measurement ---
+# Layout code measures the same strings every frame (formula prefixes, words
+# being wrapped). Measurements go through one LRU cache, so a string is only
+# shaped by FreeType the first time it is seen in a given font.
+
+class TextLayoutCache:
+    """LRU cache of text metrics keyed by (string, font, size, weight, backend, dpi), with hit/miss counters"""
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def get(self, key, measure):
+        try:
+            value = self._entries[key]
+        except KeyError:
+            self.misses += 1
+            value = self._entries[key] = measure()
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        else:
+            self.hits += 1
+            self._entries.move_to_end(key)
+        return value
+
+    def snapshot(self, exclude=()):
+        """Current entries, least recently used first, for seeding another process
+
+        Keys in `exclude` are left out.
+        """
+        return [(key, value) for key, value in self._entries.items() if key not in exclude]
+
+    def seed(self, entries):
+        for key, value in entries:
+            self._entries[key] = value
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def take_counts(self):
+        """Return (hits, misses) since the last call and reset the counters"""
+        counts = self.hits, self.misses
+        self.hits = self.misses = 0
+        return counts
+
+text_cache = TextLayoutCache()
+
+def measure_text(text, fontsize, fontfamily, fontweight='normal'):
+    """(width, height, descent) of `text` in pixels, measured by the scene's backend"""
+    family = tuple(fontfamily) if isinstance(fontfamily, (list, tuple)) else (fontfamily,)
+
+    def measure():
+        return scene.measure(text, fontsize, family, fontweight)
+    # Backends shape text differently, so their widths are kept apart
+    return text_cache.get((text, family, fontsize, fontweight, scene.backend, scene.dpi), measure)
+
+def text_width(text, fontsize, fontfamily, fontweight='normal'):
+    """Advance width of `text` in data units"""
+    width, _, _ = measure_text(text, fontsize, fontfamily, fontweight)
+    return width * VIEW_W / scene.size[0]
+
+def text_height(pixels):
+    """Convert a height in pixels to data units"""
+    return pixels * VIEW_H / scene.size[1]
+
+# Wrapped text: the lines to draw, the offset of each line in the source
+# string, and the block's height, first-line ascent and baseline-to-baseline
+# pitch in data units
+TextLayout = collections.namedtuple('TextLayout', ['lines', 'starts', 'height', 'ascent', 'pitch'])
+
+WORD = re.compile(r'\S+')
+
+class TextWrapper:
+    """Greedy word wrapping to a width in data units, using real font metrics
+
+    Each word is measured once through the text cache and lines are broken
+    and the block height computed in the same pass. Text that extends a
+    recently wrapped string (a reply being streamed in) only has its last
+    line re-wrapped: appending text cannot move an earlier greedy break.
+    """
+
+    def __init__(self, max_width, fontsize, fontfamily, fontweight='normal', linespacing=1.2, recent=8):
+        self.max_width = max_width
+        self.font = (fontsize, fontfamily, fontweight)
+        self.linespacing = linespacing
+        self._recent = collections.OrderedDict()
+        self._recent_size = recent
+
+    def wrap(self, text):
+        layout = self._recent.get(text)
+        if layout is None:
+            layout = self._wrap(text, self._prefix_layout(text))
+            self._recent[text] = layout
+            if len(self._recent) > self._recent_size:
+                self._recent.popitem(last=False)
+        self._recent.move_to_end(text)
+        return layout
+
+    def _prefix_layout(self, text):
+        """The most recent layout of a string that `text` starts with"""
+        for prefix in reversed(self._recent):
+            if text.startswith(prefix) and self._recent[prefix].lines:
+                return self._recent[prefix]
+        return None
+
+    def _wrap(self, text, prefix):
+        # Keep every line of the prefix but the last, and re-wrap from there
+        lines, starts = ([], []) if prefix is None else (list(prefix.lines[:-1]), list(prefix.starts[:-1]))
+        space = text_width(' ', *self.font)
+        pos = prefix.starts[-1] if prefix is not None else 0
+        words, line_width = [], 0
+        for match in WORD.finditer(text, pos):
+            word_width = text_width(match.group(), *self.font)
+            if words and line_width + space + word_width > self.max_width:
+                lines.append(' '.join(words))
+                words, line_width = [], 0
+            if not words:
+                starts.append(match.start())
+                line_width = word_width
+            else:
+                line_width += space + word_width
+            words.append(match.group())
+        if words:
+            lines.append(' '.join(words))
+
+        # Same line pitch as matplotlib's multi-line text layout
+        _, line_h, descent = measure_text('lp', *self.font)
+        pitch = descent + (line_h - descent) * self.linespacing
+        height = line_h + pitch * (len(lines) - 1) if lines else 0
+        return TextLayout(tuple(lines), tuple(starts), text_height(height),
+                          text_height(line_h - descent), text_height(pitch))
+
+@functools.lru_cache(maxsize=None)
+def text_wrapper(max_width, fontsize, fontfamily, fontweight='normal'):
+    """Shared wrapper per width and font, so streamed text re-wraps incrementally"""
+    return TextWrapper(max_width, fontsize, fontfamily, fontweight)
 
-def draw_ui_layout():
-    # Just light background, no container box
-    excel_bg = patches.Rectangle((excel_x, excel_y), excel_w, excel_h, facecolor='#ffffff', edgecolor='none', zorder=0)
-    ax.add_patch(excel_bg)
+# --- Helper Functions ---
 
-    # Row 1 is intentionally left blank (no title)
+def draw_rounded_rect(scene, key, x, y, w, h, r, color, ec=None, lw=1, zorder=1):
+    return scene.rounded_rect(key, x, y, w, h, r, facecolor=color, edgecolor=ec if ec else "none", linewidth=lw, zorder=zorder)
+
+# Characters per text artist in streamed text
+STREAM_CHUNK = 8
+
+def draw_streamed_text(key, x, y, lines, pitch=0, **style):
+    """Draw lines of text from baseline `y` as fixed-size chunks, one artist each
+
+    Chunk boundaries depend only on the position in the line, so as text
+    streams in the chunks already shown are left untouched and only the last
+    chunk and any new ones are redrawn, however long the text has grown. When
+    a word wraps onto the next line only the chunks that changed are redrawn.
+    Returns the x where the last line ends, for a cursor.
+    """
+    font = (style['fontsize'], style['fontfamily'], style.get('fontweight', 'normal'))
+    end_x = x
+    for row, line in enumerate(lines):
+        for start in range(0, len(line), STREAM_CHUNK):
+            scene.text((key, row, start), x + text_width(line[:start], *font), y - row * pitch,
+                       line[start:start + STREAM_CHUNK], va='baseline', **style)
+        end_x = x + text_width(line, *font)
+    return end_x
 
+def draw_ui_layout():
     # Chat Panel — single rounded rect for clean border
-    draw_rounded_rect(ax, chat_x, chat_y, chat_w, chat_h, 12, COLOR_BG_PAGE, COLOR_BORDER, lw=1, zorder=10)
+    draw_rounded_rect(scene, 'chat_panel', chat_x, chat_y, chat_w, chat_h, 12, COLOR_BG_PAGE, COLOR_BORDER, lw=1, zorder=10)
     # Header background — match panel edges exactly so no gap at top
-    header_bg = draw_rounded_rect(ax, chat_x, chat_y + chat_h - header_h, chat_w, header_h, 12, COLOR_BG_ELEVATED, zorder=50)
+    draw_rounded_rect(scene, 'chat_header_bg', chat_x, chat_y + chat_h - header_h, chat_w, header_h, 12, COLOR_BG_ELEVATED, zorder=50)
     # Cover the bottom rounded corners of the header bg so it's flat where it meets the body
-    header_cover = patches.Rectangle((chat_x, chat_y + chat_h - header_h), chat_w, header_h/2, facecolor=COLOR_BG_ELEVATED, edgecolor='none', zorder=50)
-    ax.add_patch(header_cover)
+    scene.rect('chat_header_cover', chat_x, chat_y + chat_h - header_h, chat_w, header_h/2, facecolor=COLOR_BG_ELEVATED, edgecolor='none', zorder=50)
     # Header divider line
-    ax.plot([chat_x, chat_x + chat_w], [chat_y + chat_h - header_h, chat_y + chat_h - header_h], color=COLOR_BORDER, linewidth=1, zorder=50)
-    ax.text(chat_x + 20, chat_y + chat_h - header_h/2, "HyperPerfect", fontsize=11, fontweight=700, color=COLOR_TEXT_PRIMARY, zorder=51, va='center', fontfamily=FONT_FAMILY)
-    ax.text(chat_x + chat_w - 20, chat_y + chat_h - header_h/2, "AI Chat", fontsize=10, color=COLOR_TEXT_SECONDARY, zorder=51, ha='right', va='center', fontfamily=FONT_FAMILY)
+    scene.line('chat_header_divider', [chat_x, chat_x + chat_w], [chat_y + chat_h - header_h, chat_y + chat_h - header_h], color=COLOR_BORDER, linewidth=1, zorder=50)
+    scene.text('chat_title', chat_x + 20, chat_y + chat_h - header_h/2, "HyperPerfect", fontsize=11, fontweight=700, color=COLOR_TEXT_PRIMARY, zorder=51, va='center', fontfamily=FONT_FAMILY)
+    scene.text('chat_subtitle', chat_x + chat_w - 20, chat_y + chat_h - header_h/2, "AI Chat", fontsize=10, color=COLOR_TEXT_SECONDARY, zorder=51, ha='right', va='center', fontfamily=FONT_FAMILY)
 
     # Input Box Area
-    draw_rounded_rect(ax, chat_x + 15, chat_y + 15, chat_w - 30, input_h, 12, COLOR_BG_PAGE, COLOR_BORDER, lw=1, zorder=10)
+    draw_rounded_rect(scene, 'input_box', chat_x + 15, chat_y + 15, chat_w - 30, input_h, 12, COLOR_BG_PAGE, COLOR_BORDER, lw=1, zorder=10)
 
     # Send Button
-    circle = patches.Circle((chat_x + chat_w - 45, chat_y + 45), 18, color=COLOR_BRAND, zorder=52)
-    ax.add_patch(circle)
-    triangle = patches.Polygon([[chat_x + chat_w - 49, chat_y + 52], [chat_x + chat_w - 49, chat_y + 38], [chat_x + chat_w - 37, chat_y + 45]], color='white', zorder=53)
-    ax.add_patch(triangle)
+    scene.circle('send_button', (chat_x + chat_w - 45, chat_y + 45), 18, color=COLOR_BRAND, zorder=52)
+    scene.polygon('send_arrow', [[chat_x + chat_w - 49, chat_y + 52], [chat_x + chat_w - 49, chat_y + 38], [chat_x + chat_w - 37, chat_y + 45]], color='white', zorder=53)
 
-def draw_user_message(text, y_pos):
-    """Draw a user message (right-aligned, matching app design)"""
+def draw_user_message(text, top, key='user'):
+    """Draw a user message (right-aligned, matching app design) hanging from `top`
+
+    Returns the bubble height.
+    """
     bubble_w = 480
     bubble_h = 55
     bubble_x = chat_x + chat_w - bubble_w - 20
+    y_pos = top - bubble_h
 
     # User bubble: #eff1f5 bg, 8px radius, no border
-    bubble = patches.FancyBboxPatch((bubble_x, y_pos), bubble_w, bubble_h,
-                                     boxstyle="round,pad=0,rounding_size=8",
-                                     facecolor=COLOR_BG_USER, edgecolor='none', linewidth=0, zorder=60)
-    ax.add_patch(bubble)
+    scene.rounded_rect((key, 'bubble'), bubble_x, y_pos, bubble_w, bubble_h, 8,
+                       facecolor=COLOR_BG_USER, edgecolor='none', linewidth=0, zorder=60)
     # User label
-    ax.text(bubble_x + 15, y_pos + bubble_h - 20, "User", fontsize=8, color=COLOR_TEXT_PRIMARY, zorder=61, fontweight=600, fontfamily=FONT_FAMILY)
-    ax.text(bubble_x + 15, y_pos + bubble_h - 31, text, fontsize=8, color=COLOR_TEXT_PRIMARY, zorder=61, va='top', fontweight=400, fontfamily=FONT_FAMILY)
-
-def wrap_text(text, max_chars=38):
-    """Manually wrap text at word boundaries"""
-    words = text.split()
-    lines = []
-    current_line = ""
-    for word in words:
-        if len(current_line) + len(word) + 1 <= max_chars:
-            current_line = current_line + " " + word if current_line else word
-        else:
-            if current_line:
-                lines.append(current_line)
-            current_line = word
-    if current_line:
-        lines.append(current_line)
-    return "\n".join(lines)
-
-def draw_bot_message(text, y_pos, final_height=None):
-    """Draw a bot message (left-aligned, transparent bg, matching app design)"""
+    scene.text((key, 'label'), bubble_x + 15, y_pos + bubble_h - 20, "User", fontsize=8, color=COLOR_TEXT_PRIMARY, zorder=61, fontweight=600, fontfamily=FONT_FAMILY)
+    scene.text((key, 'text'), bubble_x + 15, y_pos + bubble_h - 31, text, fontsize=8, color=COLOR_TEXT_PRIMARY, zorder=61, va='top', fontweight=400, fontfamily=FONT_FAMILY)
+    return bubble_h
+
+def draw_bot_message(text, top, final_text=None, key='bot'):
+    """Draw a bot message (left-aligned, transparent bg, matching app design) hanging from `top`
+
+    The bubble is sized for `final_text` when given, so a reply that is still
+    streaming in already takes its final height and grows downward, away
+    from the messages above. Returns the bubble height.
+    """
     bubble_w = 380
-    if final_height is not None:
-        bubble_h = final_height
-    else:
-        bubble_h = max(60, len(text) // 35 * 20 + 40)
     bubble_x = chat_x + 20
+    wrapper = text_wrapper(bubble_w - 30, 8, FONT_FAMILY, 400)
+    layout = wrapper.wrap(text)
+    # Label and padding above the text, a few units below it
+    bubble_h = max(55, wrapper.wrap(final_text or text).height + 35)
+    y_pos = top - bubble_h
 
     # Assistant messages: transparent background, no bubble (matches app)
     # Invisible rect just for layout spacing
-    bubble = patches.FancyBboxPatch((bubble_x, y_pos), bubble_w, bubble_h,
-                                     boxstyle="round,pad=0,rounding_size=8",
-                                     facecolor=COLOR_BG_PAGE, edgecolor='none', linewidth=0, zorder=60)
-    ax.add_patch(bubble)
+    scene.rounded_rect((key, 'bubble'), bubble_x, y_pos, bubble_w, bubble_h, 8,
+                       facecolor=COLOR_BG_PAGE, edgecolor='none', linewidth=0, zorder=60)
 
     # HyperPerfect label - brand color, semibold
-    ax.text(bubble_x + 10, y_pos + bubble_h - 18, "HyperPerfect", fontsize=7, color=COLOR_BRAND, zorder=61, fontweight=600, fontfamily=FONT_FAMILY)
-    # Text with manual wrapping
-    wrapped_text = wrap_text(text)
-    ax.text(bubble_x + 15, y_pos + bubble_h - 32, wrapped_text, fontsize=8, color=COLOR_TEXT_PRIMARY, zorder=61, va='top', fontweight=400, fontfamily=FONT_FAMILY)
+    scene.text((key, 'label'), bubble_x + 10, y_pos + bubble_h - 18, "HyperPerfect", fontsize=7, color=COLOR_BRAND, zorder=61, fontweight=600, fontfamily=FONT_FAMILY)
+    # Reply text streams in chunk by chunk, top of the first line 32 below the bubble top
+    draw_streamed_text((key, 'text'), bubble_x + 15, y_pos + bubble_h - 32 - layout.ascent, layout.lines, layout.pitch,
+                       fontsize=8, color=COLOR_TEXT_PRIMARY, zorder=61, fontweight=400, fontfamily=FONT_FAMILY)
+    return bubble_h
 
 def draw_thinking_indicator(y_pos):
     """Draw thinking indicator"""
@@ -137,15 +1342,18 @@ def draw_thinking_indicator(y_pos):
     bubble_h = 50
     bubble_x = chat_x + 20
 
-    draw_rounded_rect(ax, bubble_x, y_pos, bubble_w, bubble_h, 8, COLOR_BG_PAGE)
-    ax.text(bubble_x + 10, y_pos + 32, "HyperPerfect", fontsize=7, color=COLOR_BRAND, zorder=3, fontweight=600, fontfamily=FONT_FAMILY)
-    ax.text(bubble_x + 15, y_pos + 18, "Thinking...", fontsize=9, color=COLOR_TEXT_SECONDARY, zorder=3, va='top', style='italic', fontfamily=FONT_FAMILY)
+    draw_rounded_rect(scene, ('thinking', 'bubble'), bubble_x, y_pos, bubble_w, bubble_h, 8, COLOR_BG_PAGE)
+    scene.text(('thinking', 'label'), bubble_x + 10, y_pos + 32, "HyperPerfect", fontsize=7, color=COLOR_BRAND, zorder=3, fontweight=600, fontfamily=FONT_FAMILY)
+    scene.text(('thinking', 'text'), bubble_x + 15, y_pos + 18, "Thinking...", fontsize=9, color=COLOR_TEXT_SECONDARY, zorder=3, va='top', style='italic', fontfamily=FONT_FAMILY)
 
 def draw_input_placeholder(text, show_cursor=True):
     """Draw input text in the input box"""
-    cursor = "|" if show_cursor else ""
-    # zorder must be higher than input box background (zorder=10)
-    ax.text(chat_x + 30, chat_y + 40, text + cursor, fontsize=8, color=COLOR_TEXT_PRIMARY, zorder=15, fontweight=400, fontfamily=FONT_FAMILY)
+    style = dict(fontsize=8, color=COLOR_TEXT_PRIMARY, zorder=15, fontweight=400, fontfamily=FONT_FAMILY)
+    end_x = draw_streamed_text('input_text', chat_x + 30, chat_y + 40, [text], **style)
+    # The cursor is an overlay, so blinking it leaves the chat layer untouched
+    if show_cursor:
+        with scene.layer('chat_overlay'):
+            scene.text('input_cursor', end_x, chat_y + 40, "|", **style)
 
 def draw_file_attachment():
     """Draw a file attachment indicator above the input box"""
@@ -156,221 +1364,468 @@ def draw_file_attachment():
     # Lucide paperclip icon (outside the pill)
     icon_x = base_x + 12
     icon_y = base_y + pill_h/2
-    imagebox = OffsetImage(PAPERCLIP_IMG, zoom=0.18)
-    ab = AnnotationBbox(imagebox, (icon_x, icon_y), frameon=False, zorder=16)
-    ax.add_artist(ab)
+    scene.image(('attachment', 'icon'), 'paperclip.png', (icon_x, icon_y), zoom=0.18, zorder=16)
 
     # "File Uploaded:" label (outside the pill, tertiary color)
-    ax.text(base_x + 28, base_y + pill_h/2, "File Uploaded:", fontsize=8, color=COLOR_TEXT_TERTIARY,
-            ha='left', va='center', zorder=16, fontweight=400, fontfamily=FONT_FAMILY)
+    scene.text(('attachment', 'label'), base_x + 28, base_y + pill_h/2, "File Uploaded:", fontsize=8, color=COLOR_TEXT_TERTIARY,
+               ha='left', va='center', zorder=16, fontweight=400, fontfamily=FONT_FAMILY)
 
     # Pill only around the filename
     pill_x = base_x + 175
     pill_w = 220
 
     # File attachment pill (matching app: #f2f3f6 bg, #e2e5eb border)
-    pill = patches.FancyBboxPatch((pill_x, base_y), pill_w, pill_h,
-                                   boxstyle="round,pad=0,rounding_size=4",
-                                   facecolor=COLOR_BG_TOOL, edgecolor=COLOR_BORDER, linewidth=1, zorder=15)
-    ax.add_patch(pill)
+    scene.rounded_rect(('attachment', 'pill'), pill_x, base_y, pill_w, pill_h, 4,
+                       facecolor=COLOR_BG_TOOL, edgecolor=COLOR_BORDER, linewidth=1, zorder=15)
 
     # Filename (brand color, medium weight)
-    ax.text(pill_x + 10, base_y + pill_h/2, "Apple Financials.pdf", fontsize=8, color=COLOR_BRAND,
-            ha='left', va='center', zorder=16, fontweight=500, fontfamily=FONT_FAMILY)
-
-def draw_excel_cell(x, y, w, h, text, color='white', text_color='#212529', fontweight='normal', fontsize=10, highlight=False, is_formula=False, align='center', fontfamily='sans-serif'):
-    """Draw an Excel cell"""
-    border_color = '#2d6a4f' if highlight else 'none'
-    border_width = 2.5 if highlight else 0
-
-    cell_rect = patches.Rectangle((x, y), w, h, facecolor='none', edgecolor=border_color, linewidth=border_width, zorder=2)
-    ax.add_patch(cell_rect)
-
-    if text:
-        if align == 'left':
-            text_x = x + 5
-        elif align == 'right':
-            text_x = x + w - 5
-        else:  # center
-            text_x = x + w/2
-
-        # Add white background behind text to hide cell borders
-        text_obj = ax.text(text_x, y + h/2, str(text), fontsize=fontsize if not is_formula else fontsize - 1,
-                          color='#d9534f' if is_formula else text_color,
-                          ha=align, va='center', fontweight=fontweight, zorder=3, fontfamily=fontfamily,
-                          bbox=dict(boxstyle='square,pad=0.4', facecolor='white', edgecolor='none', zorder=2))
-
-# Cell reference colors for formula highlighting
-CELL_REF_COLORS = {
-    'C4': COLOR_BRAND,  # Blue - Discount Rate
-    'G9': '#dc3545',    # Red - FCF 2028E
-    'C3': '#6f42c1',    # Purple - Terminal Multiple (moved to row 3)
-    'C9:G9': '#198754', # Green - FCF range
+    scene.text(('attachment', 'filename'), pill_x + 10, base_y + pill_h/2, "Apple Financials.pdf", fontsize=8, color=COLOR_BRAND,
+               ha='left', va='center', zorder=16, fontweight=500, fontfamily=FONT_FAMILY)
+
+# --- Sheet Model ---
+# The Excel panel is described as cells by A1 address rather than drawn row
+# by row, so a frame only restates the cells that changed.
+
+# A cell's value, the str.format() pattern or CELL_FORMATS name it is
+# displayed with, its CELL_STYLES entry, and the formula it holds, if any.
+# Cells are part of the frame specs, so every field has a stable repr.
+Cell = collections.namedtuple('Cell', ['value', 'format', 'style', 'formula'], defaults=[None, 'number', None])
+
+# How each kind of cell is drawn. Text gets a white box to hide the grid lines
+# beneath it unless boxed=False; fill puts a background behind the whole cell.
+CELL_STYLES = {
+    'label': dict(fontsize=8, ha='left'),
+    'section': dict(fontsize=8, fontweight='bold', ha='left'),
+    'heading': dict(fontsize=8, fontweight='bold', ha='left', boxed=False),
+    'year': dict(fontsize=9, fontweight='bold', color='white', fill='#1e5a96', boxed=False),
+    'input': dict(fontsize=9, color='#0d6efd'),
+    'number': dict(fontsize=8),
+    'total': dict(fontsize=8, fontweight='bold', ha='left'),
+    'result': dict(fontsize=8, fontweight='bold'),
+    # A formula being typed (the value) into the cell, with colored
+    # references, spilling over to the last column
+    'formula': dict(fontsize=9),
 }
 
-# Cell positions in our grid (column index, row index from top)
-# Row 1 = title, Row 2 = Major Assumptions header, Row 3 = Terminal Multiple, Row 4 = Discount Rate
-# Row 7 = Projections header, Row 8 = Revenue, Row 9 = FCF
-# Row 10 = Enterprise Value
-CELL_POSITIONS = {
-    'C3': (2, 2),   # Column C (index 2), Row 3 (Terminal Multiple - 10x)
-    'C4': (2, 3),   # Column C (index 2), Row 4 (Discount Rate - 8%)
-    'G9': (6, 8),   # Column G (index 6), Row 9 (FCF 2028E - 154B)
-    'C9': (2, 8),   # Start of FCF range
-    'G9_range': (6, 8),  # End of FCF range
+def format_billions(value):
+    """'$1.6T' from 1607 (billions), '$845B' below a trillion"""
+    return f'${value / 1000:.1f}T' if abs(value) >= 1000 else f'${value:.0f}B'
+
+# Formats a str.format() pattern can't express
+CELL_FORMATS = {
+    'billions': format_billions,
 }
 
-def draw_colored_formula(ax, x, y, formula_text, fontsize=9):
-    """Draw formula character by character with colored cell references"""
-    # Formula: =PV(C4, 5, 0, -G9 * C3) + NPV(C4, C9:G9)
-    # Total length: 40 characters
-    full_formula = "=PV(C4, 5, 0, -G9 * C3) + NPV(C4, C9:G9)"
-
-    # Define character ranges for each colored reference (start, end exclusive, color)
-    # Verified positions from formula analysis
-    color_ranges = [
-        (4, 6, CELL_REF_COLORS['C4']),      # First C4 at positions 4-5
-        (15, 17, CELL_REF_COLORS['G9']),    # G9 at positions 15-16
-        (20, 22, CELL_REF_COLORS['C3']),    # C3 at positions 20-21
-        (30, 32, CELL_REF_COLORS['C4']),    # Second C4 at positions 30-31
-        (34, 39, CELL_REF_COLORS['C9:G9']), # C9:G9 at positions 34-38
-    ]
-
-    char_width = 11.0  # Character width for monospace font (Menlo at fontsize 9)
-
-    for i, char in enumerate(formula_text):
-        if i >= len(full_formula):
-            break
-
-        # Determine color for this character
-        char_color = '#212529'  # Default black
-
-        for start, end, color in color_ranges:
-            if start <= i < end:
-                # Only color if the entire reference is visible
-                if len(formula_text) >= end:
-                    char_color = color
+def cell_text(cell):
+    if cell.format in CELL_FORMATS:
+        return CELL_FORMATS[cell.format](cell.value)
+    return cell.format.format(cell.value) if cell.format else str(cell.value)
+
+@functools.lru_cache(maxsize=None)
+def cell_position(ref):
+    """(column index, row index from the top) of an A1 address like 'C4' or '$G$9'"""
+    letters, row = re.fullmatch(r'\$?([A-Z]+)\$?(\d+)', ref).groups()
+    col = 0
+    for letter in letters:
+        col = col * 26 + ord(letter) - ord('A') + 1
+    return col - 1, int(row) - 1
+
+def cell_origin(col, row):
+    """Bottom left corner of a cell in the grid"""
+    return start_x + col * cell_w, start_y - row * (cell_h + 1)
+
+def draw_sheet_cell(ref, cell, colors=None):
+    """Draw one cell of the sheet model in its CELL_STYLES style
+
+    `colors` are the reference colors of the formulas on screen.
+    """
+    style = CELL_STYLES[cell.style]
+    col, row = cell_position(ref)
+    x, y = cell_origin(col, row)
+
+    if cell.style == 'formula':
+        span = (len(COL_LETTERS) - col) * cell_w
+        # Draw white background to cover cell borders as formula expands
+        scene.rect(('cell', ref, 'formula_bg'), x, y, span, cell_h, facecolor='white', edgecolor='none', zorder=2)
+        draw_colored_formula(scene, ('cell', ref), x + 5, y + cell_h/2, cell.value, fontsize=style['fontsize'],
+                             max_width=span - 20, complete=cell.formula, colors=colors)
+        return
+
+    if 'fill' in style:
+        # zorder=0 keeps the background beneath the cell text
+        scene.rect(('cell', ref, 'fill'), x, y, cell_w, cell_h, facecolor=style['fill'], edgecolor='none', linewidth=0, zorder=0)
+    ha = style.get('ha', 'center')
+    extra = {}
+    if style.get('boxed', True):
+        extra['bbox'] = dict(boxstyle='square,pad=0.4', facecolor='white', edgecolor='none', zorder=2)
+    scene.text(('cell', ref, 'text'), x + 5 if ha == 'left' else x + cell_w/2, y + cell_h/2, cell_text(cell),
+               fontsize=style['fontsize'], color=style.get('color', '#212529'), ha=ha, va='center',
+               fontweight=style.get('fontweight', 'normal'), zorder=3, fontfamily='sans-serif', **extra)
+
+# --- Formula Tokenizer ---
+# Formulas are colored and their references outlined from the tokens of the
+# text typed so far, so any formula can be animated.
+
+# kind is 'ref' (a cell, or a range like C9:G9), 'function', 'name',
+# 'number', 'string', 'operator', 'paren', 'separator', 'space' or 'other';
+# start and end index the formula text
+Token = collections.namedtuple('Token', ['kind', 'start', 'end'])
+
+# One alternative per token kind, tried in order at each position. Ranges are
+# joined from their two cell references as tokens are emitted.
+FORMULA_TOKEN = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<string>"(?:[^"]|"")*"?)
+  | (?P<ref>\$?[A-Za-z]{1,3}\$?[0-9]+(?![\w.(]))
+  | (?P<function>[A-Za-z_][\w.]*(?=\())
+  | (?P<name>[A-Za-z_$][\w.$]*)
+  | (?P<number>[0-9]+\.?[0-9]*(?:[eE][-+]?[0-9]+)?|\.[0-9]+)
+  | (?P<operator><=|>=|<>|[-+*/^&=<>%:])
+  | (?P<paren>[()])
+  | (?P<separator>[,;])
+  | (?P<other>.)
+''', re.VERBOSE | re.DOTALL)
+
+# Tokens of a string, of which the first `stable` can't be changed by typing more
+FormulaScan = collections.namedtuple('FormulaScan', ['tokens', 'stable'])
+
+class FormulaTokenizer:
+    """Excel formula tokens in a single linear pass, resumed while the formula is typed
+
+    Appending text can only change the tokens after the last delimiter
+    (space, parenthesis or separator), so a formula that extends a recently
+    tokenized one keeps everything before that and scans only from there. A
+    typing frame costs about the characters it adds.
+    """
+
+    def __init__(self, recent=8):
+        self._recent = collections.OrderedDict()
+        self._recent_size = recent
+
+    def tokenize(self, text):
+        scan = self._recent.get(text)
+        if scan is None:
+            scan = self._scan(text, self._prefix_scan(text))
+            self._recent[text] = scan
+            if len(self._recent) > self._recent_size:
+                self._recent.popitem(last=False)
+        self._recent.move_to_end(text)
+        return scan.tokens
+
+    def _prefix_scan(self, text):
+        """The most recent scan of a string that `text` starts with"""
+        for prefix in reversed(self._recent):
+            if text.startswith(prefix):
+                return self._recent[prefix]
+        return None
+
+    @staticmethod
+    def _scan(text, prefix):
+        stable = 0 if prefix is None else prefix.stable
+        tokens = [] if prefix is None else list(prefix.tokens[:stable])
+        for match in FORMULA_TOKEN.finditer(text, tokens[-1].end if tokens else 0):
+            token = Token(match.lastgroup, match.start(), match.end())
+            # A cell reference right after 'cell:' completes a range
+            if token.kind == 'ref' and len(tokens) >= 2 and tokens[-2].kind == 'ref' and text[tokens[-1].start:token.start] == ':':
+                token = Token('ref', tokens[-2].start, token.end)
+                del tokens[-2:]
+            tokens.append(token)
+        # Everything up to the last space, parenthesis or separator before the
+        # final token is settled; tokens after it may still change with more
+        # text (a number gaining an exponent, a cell becoming a range)
+        for index in range(len(tokens) - 2, stable - 1, -1):
+            if tokens[index].kind in ('space', 'paren', 'separator'):
+                stable = index + 1
                 break
-
-        char_x = x + i * char_width
-        ax.text(char_x, y, char, fontsize=fontsize, color=char_color,
-                ha='left', va='center', zorder=4, fontfamily='Menlo', fontweight='bold')
-
-def draw_cell_reference_highlights(ax, formula_text, start_x, start_y, cell_w, cell_h):
-    """Draw colored outlines on referenced cells only when reference is fully typed"""
-    # Check which complete references are in the formula text
-    refs_to_highlight = []
-
-    # Formula: =PV(C4, 5, 0, -G9 * C3) + NPV(C4, C9:G9)
-    # Total length: 40 characters
-    # Verified positions:
-    # - First C4 at positions 4-5 (need length >= 6)
-    # - G9 at positions 15-16 (need length >= 17)
-    # - C3 at positions 20-21 (need length >= 22)
-    # - Second C4 at positions 30-31 (need length >= 32)
-    # - C9:G9 at positions 34-38 (need length >= 39)
-
-    # First C4 at positions 4-5 (need length >= 6)
-    if len(formula_text) >= 6:
-        refs_to_highlight.append(('C4', CELL_REF_COLORS['C4']))
-
-    # G9 at positions 15-16 (need length >= 17)
-    if len(formula_text) >= 17:
-        refs_to_highlight.append(('G9', CELL_REF_COLORS['G9']))
-
-    # C3 at positions 20-21 (need length >= 22)
-    if len(formula_text) >= 22:
-        refs_to_highlight.append(('C3', CELL_REF_COLORS['C3']))
-
-    # C9:G9 at positions 34-38 (need length >= 39 for complete reference)
-    if len(formula_text) >= 39:
-        refs_to_highlight.append(('C9:G9', CELL_REF_COLORS['C9:G9']))
-
-    for ref, color in refs_to_highlight:
-        if ref == 'C9:G9':
-            # Highlight range C9 to G9 as ONE continuous outline (columns 2-6, row 8)
-            range_x = start_x + 2 * cell_w  # Start at column C
-            range_y = start_y - 8 * (cell_h + 1)  # Row 9 (0-indexed row 8)
-            range_width = 5 * cell_w  # 5 columns (C, D, E, F, G)
-            highlight_rect = patches.Rectangle(
-                (range_x, range_y), range_width, cell_h,
-                facecolor='none', edgecolor=color, linewidth=1.5, zorder=5
-            )
-            ax.add_patch(highlight_rect)
-        elif ref in CELL_POSITIONS:
-            col, row = CELL_POSITIONS[ref]
-            cell_x = start_x + col * cell_w
-            cell_y = start_y - row * (cell_h + 1)
-            highlight_rect = patches.Rectangle(
-                (cell_x, cell_y), cell_w, cell_h,
-                facecolor='none', edgecolor=color, linewidth=1.5, zorder=5
-            )
-            ax.add_patch(highlight_rect)
-
-def draw_excel_header_cell(x, y, w, h, text, bg_color='none', text_color='#212529'):
-    """Draw header cell (text only, no background)"""
-    # Use zorder=0 for background so it appears behind chat window overlay
-    header_rect = patches.Rectangle((x, y), w, h, facecolor=bg_color, edgecolor='none', linewidth=0, zorder=0)
-    ax.add_patch(header_rect)
-    ax.text(x + w/2, y + h/2, text, fontsize=9, color=text_color,
-            ha='center', va='center', fontweight='bold', zorder=3, fontfamily='sans-serif')
-
-def draw_section_header(x, y, w, h, text, fontweight='normal'):
-    """Draw section header cell (text only, no background, left aligned)"""
-    header_rect = patches.Rectangle((x, y), w, h, facecolor='none', edgecolor='none', linewidth=0, zorder=2)
-    ax.add_patch(header_rect)
-    ax.text(x + 5, y + h/2, text, fontsize=8, color='#212529',
-            ha='left', va='center', fontweight=fontweight, zorder=3, fontfamily='sans-serif')
+        return FormulaScan(tuple(tokens), stable)
+
+formula_tokenizer = FormulaTokenizer()
+
+def formula_references(formula_text):
+    """(start, end, reference) of each cell or range reference in the formula, in order"""
+    return [(token.start, token.end, formula_text[token.start:token.end].upper())
+            for token in formula_tokenizer.tokenize(formula_text) if token.kind == 'ref']
+
+# Excel outlines each distinct reference in a formula in the next color of a
+# fixed palette, in order of first appearance
+REF_COLORS = [COLOR_BRAND, '#dc3545', '#6f42c1', '#198754']
+
+def reference_colors(formula_text, colors=None):
+    """{reference: color} for the cell and range references in the formula
+
+    Pass the `colors` of other formulas on screen to continue their palette
+    rather than start it over; the dict is extended in place.
+    """
+    colors = {} if colors is None else colors
+    for _, _, ref in formula_references(formula_text):
+        colors.setdefault(ref, REF_COLORS[len(colors) % len(REF_COLORS)])
+    return colors
+
+# Menlo where installed, otherwise matplotlib's bundled monospace font
+FORMULA_FONT = ['Menlo', 'DejaVu Sans Mono']
+
+def formula_runs(formula_text, colors=None, default_color='#212529'):
+    """Split typed formula text into (start, end, color) runs of a single color
+
+    References are colored as soon as they are complete, as in Excel: a cell
+    that is still being typed is colored as the cell typed so far. `colors`
+    assigns the reference colors, by default from this formula alone.
+    """
+    colors = reference_colors(formula_text, colors)
+    runs = []
+
+    def add(start, end, color):
+        if start >= end:
+            return
+        if runs and runs[-1][2] == color:
+            runs[-1] = (runs[-1][0], end, color)
+        else:
+            runs.append((start, end, color))
+
+    pos = 0
+    for start, end, ref in formula_references(formula_text):
+        add(pos, start, default_color)
+        add(start, end, colors[ref])
+        pos = end
+    add(pos, len(formula_text), default_color)
+    return runs
+
+def draw_colored_formula(scene, key, x, y, formula_text, fontsize=9, max_width=None, complete=None, colors=None):
+    """Draw formula as text artists of same-colored characters
+
+    `complete` is the whole formula when `formula_text` is still being typed,
+    and `colors` the reference colors shared with other formulas on screen.
+    """
+    # Size the font so the complete formula fits; glyphs then never shift while typing.
+    # Hinting rounds advances to whole pixels, so re-measure until it really fits.
+    complete = complete or formula_text
+    if max_width is not None:
+        while fontsize > 1 and (width := text_width(complete, fontsize, FORMULA_FONT, 'bold')) > max_width:
+            fontsize = min(fontsize * max_width / width, fontsize - 0.1)
+
+    for start, end, color in formula_runs(formula_text, colors):
+        # Runs are split into STREAM_CHUNK-aligned pieces, so typing only
+        # redraws the last piece. Each starts at the advance width of
+        # everything typed before it.
+        pos = start
+        while pos < end:
+            chunk_end = min(end, (pos // STREAM_CHUNK + 1) * STREAM_CHUNK)
+            chunk_x = x + text_width(formula_text[:pos], fontsize, FORMULA_FONT, 'bold')
+            scene.text((*key, 'formula', pos), chunk_x, y, formula_text[pos:chunk_end], fontsize=fontsize, color=color,
+                       ha='left', va='center', zorder=4, fontfamily=FORMULA_FONT, fontweight='bold')
+            pos = chunk_end
+
+def draw_reference_highlight(ref, color):
+    """Outline a referenced cell, or a range as ONE continuous outline"""
+    first, _, last = ref.partition(':')
+    (c0, r0), (c1, r1) = cell_position(first), cell_position(last or first)
+    x, y = cell_origin(min(c0, c1), max(r0, r1))
+    scene.rect(('ref_highlight', ref), x, y, (abs(c1 - c0) + 1) * cell_w, abs(r1 - r0) * (cell_h + 1) + cell_h,
+               facecolor='none', edgecolor=color, linewidth=1.5, zorder=5)
+
+class Sheet:
+    """The Excel panel's cells by A1 address, with dirty tracking
+
+    update() takes the next frame's cells and marks the addresses whose cell
+    or reference highlight differs from the last frame; draw() only restates
+    those and keeps everything else as it was drawn. Highlights follow the
+    formulas being typed.
+    """
+
+    def __init__(self):
+        self.cells = {}
+        self.highlights = {}
+        self.dirty = set()
+        self.dirty_highlights = set()
+
+    def update(self, cells):
+        """Replace the contents with `cells`, {address: Cell} or (address, Cell) pairs"""
+        cells = dict(cells)
+        highlights = {}
+        for cell in cells.values():
+            if cell.style == 'formula':
+                # One palette across all formulas, so no two references share a color
+                reference_colors(cell.value, highlights)
+        self.dirty |= {ref for ref in self.cells.keys() | cells.keys() if self.cells.get(ref) != cells.get(ref)}
+        self.dirty_highlights |= {ref for ref in self.highlights.keys() | highlights.keys()
+                                  if self.highlights.get(ref) != highlights.get(ref)}
+        self.cells, self.highlights = cells, highlights
+
+    def _keep(self, ref, cell):
+        # Formula chunks vary with what has been typed, so those are always restated
+        if ref in self.dirty or cell.style == 'formula':
+            return False
+        parts = ('text', 'fill') if 'fill' in CELL_STYLES[cell.style] else ('text',)
+        return scene.keep(*(('cell', ref, part) for part in parts))
+
+    def draw(self):
+        for ref, cell in self.cells.items():
+            if not self._keep(ref, cell):
+                draw_sheet_cell(ref, cell, self.highlights)
+        # Outlines are an overlay, so typing the formula leaves the sheet layer untouched
+        with scene.layer('sheet_overlay'):
+            for ref, color in self.highlights.items():
+                if ref in self.dirty_highlights or not scene.keep(('ref_highlight', ref)):
+                    draw_reference_highlight(ref, color)
+        self.dirty.clear()
+        self.dirty_highlights.clear()
+
+sheet = Sheet()
+
+GRID_ROWS = 15
+COL_LETTERS = ['A', 'B', 'C', 'D', 'E', 'F', 'G']
+
+@functools.lru_cache(maxsize=None)
+def grid_geometry():
+    """Precomputed grid line segments and row header boxes as NumPy arrays"""
+    col_x = start_x + np.arange(len(COL_LETTERS) + 1) * cell_w
+    row_y = start_y - np.arange(GRID_ROWS) * (cell_h + 1)
+
+    # One vertical segment per column boundary per row, then one horizontal line per row
+    vx, vy = np.meshgrid(col_x, row_y, indexing='ij')
+    vertical = np.stack([np.stack([vx, vy], -1), np.stack([vx, vy + cell_h], -1)], axis=-2).reshape(-1, 2, 2)
+    horizontal = np.stack([np.stack([np.full_like(row_y, col_x[0]), row_y], -1),
+                           np.stack([np.full_like(row_y, col_x[-1]), row_y], -1)], axis=1)
+    grid_lines = np.concatenate([vertical, horizontal])
+
+    # Faint dividers between column letters (not before the first column)
+    header_y0, header_y1 = start_y + cell_h, start_y + cell_h * 2
+    dividers = np.stack([np.stack([col_x[1:-1], np.full(len(COL_LETTERS) - 1, header_y0)], -1),
+                         np.stack([col_x[1:-1], np.full(len(COL_LETTERS) - 1, header_y1)], -1)], axis=1)
+
+    # Row number boxes to the left of column A
+    x0, x1 = start_x - 40, start_x
+    row_headers = np.stack([np.stack([np.full_like(row_y, x0), row_y], -1),
+                            np.stack([np.full_like(row_y, x1), row_y], -1),
+                            np.stack([np.full_like(row_y, x1), row_y + cell_h], -1),
+                            np.stack([np.full_like(row_y, x0), row_y + cell_h], -1)], axis=1)
+    return grid_lines, dividers, row_headers
 
 def draw_excel_grid():
     """Draw the Excel grid background with column letters and row numbers"""
-    # Column letters
-    col_letters = ['A', 'B', 'C', 'D', 'E', 'F', 'G']
-    col_width = cell_w
-
-    # Top column header (gray background, high zorder)
-    header_bg = patches.Rectangle((start_x, start_y + cell_h), len(col_letters) * col_width, cell_h,
-                                   facecolor='#d3d3d3', edgecolor='#999999', linewidth=1, zorder=6)
-    ax.add_patch(header_bg)
-
-    # Draw column letters with faint vertical dividers
-    for i, letter in enumerate(col_letters):
-        col_x = start_x + i * col_width
-        ax.text(col_x + col_width/2, start_y + cell_h + cell_h/2, letter, fontsize=8, color='#212529',
-                ha='center', va='center', fontweight='bold', zorder=7, fontfamily='sans-serif')
-        # Draw faint vertical line between columns (except before first column)
-        if i > 0:
-            ax.plot([col_x, col_x], [start_y + cell_h, start_y + cell_h * 2], color='#b0b0b0', linewidth=1, zorder=7)
-
-    # Row numbers on the left (gray background)
-    for row_num in range(1, 16):
-        row_y = start_y - (row_num - 1) * (cell_h + 1)
+    grid_lines, dividers, row_headers = grid_geometry()
 
-        # Row number background (high zorder to appear on top of cell text backgrounds)
-        row_bg = patches.Rectangle((start_x - 40, row_y), 40, cell_h,
-                                   facecolor='#d3d3d3', edgecolor='#999999', linewidth=1, zorder=6)
-        ax.add_patch(row_bg)
-
-        # Row number text
-        ax.text(start_x - 20, row_y + cell_h/2, str(row_num), fontsize=7, color='#212529',
-                ha='center', va='center', fontweight='bold', zorder=7, fontfamily='sans-serif')
-
-    # Draw vertical and horizontal grid lines
-    for i in range(len(col_letters) + 1):
-        col_x = start_x + i * col_width
-        # Vertical lines
-        for row_num in range(1, 16):
-            row_y = start_y - (row_num - 1) * (cell_h + 1)
-            ax.plot([col_x, col_x], [row_y, row_y + cell_h], color='#e0e0e0', linewidth=0.5, zorder=0)
-
-    # Horizontal lines
-    for row_num in range(1, 16):
-        row_y = start_y - (row_num - 1) * (cell_h + 1)
-        ax.plot([start_x, start_x + len(col_letters) * col_width], [row_y, row_y], color='#e0e0e0', linewidth=0.5, zorder=0)
+    # Just light background, no container box
+    scene.rect('excel_bg', excel_x, excel_y, excel_w, excel_h, facecolor='#ffffff', edgecolor='none', zorder=0)
 
-# --- Animation Frame Generation ---
+    # Row 1 is intentionally left blank (no title)
 
-frames = []
+    # Top column header (gray background, high zorder)
+    scene.rect('col_header_bg', start_x, start_y + cell_h, len(COL_LETTERS) * cell_w, cell_h,
+               facecolor='#d3d3d3', edgecolor='#999999', linewidth=1, zorder=6)
+
+    # Column letters with faint vertical dividers
+    for i, letter in enumerate(COL_LETTERS):
+        col_x = start_x + i * cell_w
+        scene.text(('col_letter', i), col_x + cell_w/2, start_y + cell_h + cell_h/2, letter, fontsize=8, color='#212529',
+                   ha='center', va='center', fontweight='bold', zorder=7, fontfamily='sans-serif')
+    scene.lines('col_dividers', dividers, color='#b0b0b0', linewidth=1, zorder=7)
+
+    # Row number backgrounds (high zorder to appear on top of cell text backgrounds)
+    scene.polygons('row_header_bgs', row_headers, facecolor='#d3d3d3', edgecolor='#999999', linewidth=1, zorder=6)
+    for row_num in range(1, GRID_ROWS + 1):
+        row_y = start_y - (row_num - 1) * (cell_h + 1)
+        scene.text(('row_number', row_num), start_x - 20, row_y + cell_h/2, str(row_num), fontsize=7, color='#212529',
+                   ha='center', va='center', fontweight='bold', zorder=7, fontfamily='sans-serif')
+
+    # Vertical and horizontal grid lines
+    scene.lines('grid_lines', grid_lines, color='#e0e0e0', linewidth=0.5, zorder=0)
+
+# --- DCF Engine ---
+# The sheet's numbers are computed, not typed in. Inputs are NumPy arrays
+# that broadcast against each other, so one call values a whole grid of
+# discount rate x terminal multiple scenarios, or several companies at once.
+
+# A company's projected financials in billions, one entry per year, and its
+# base case assumptions
+Financials = collections.namedtuple('Financials', ['years', 'revenue', 'fcf', 'terminal_multiple', 'discount_rate'])
+
+APPLE = Financials(
+    years=('2025A', '2026E', '2027E', '2028E', '2029E'),
+    revenue=(394, 412, 430, 445, 459),
+    fcf=(126, 135, 142, 148, 154),
+    terminal_multiple=10,
+    discount_rate=0.08,
+)
+
+def enterprise_value(fcf, discount_rate, terminal_multiple):
+    """=PV(rate, n, 0, -FCF[n] * multiple) + NPV(rate, FCF), for arrays of inputs
+
+    `fcf` holds the n projected years on its last axis. Its other axes,
+    `discount_rate` and `terminal_multiple` broadcast together, and the
+    result has their broadcast shape.
+    """
+    fcf = np.asarray(fcf, dtype=float)
+    rate = np.asarray(discount_rate, dtype=float)[..., np.newaxis]
+    # Year t is discounted by (1 + rate)^t, as in Excel's NPV and PV
+    discount = (1 + rate) ** -np.arange(1, fcf.shape[-1] + 1)
+    npv = (fcf * discount).sum(axis=-1)
+    terminal_value = fcf[..., -1] * np.asarray(terminal_multiple, dtype=float)
+    return terminal_value * discount[..., -1] + npv
+
+def scenario_grid(financials, discount_rates, terminal_multiples):
+    """Enterprise value of every (discount rate, terminal multiple) pair, shaped (rates, multiples)"""
+    rates = np.asarray(discount_rates, dtype=float)[:, np.newaxis]
+    multiples = np.asarray(terminal_multiples, dtype=float)[np.newaxis, :]
+    return enterprise_value(financials.fcf, rates, multiples)
+
+# --- Animation Timeline ---
+
+class Timeline:
+    """Keyframed description of the demo, expanded into frame specs on demand
+
+    The demo is authored as a list of segments: holds that keep the current
+    UI state for a number of frames, and tweens that step a value (typically
+    the number of characters typed) over a range. Segment states share their
+    chat_messages and sheet tuples, so memory grows with the number of
+    segments rather than frames x scene size. Frame dicts are only built when
+    indexed or iterated.
+    """
+
+    def __init__(self, **state):
+        self.state = state
+        self._segments = []  # (phase, steps, state); state values may be callables of the step
+        self._starts = []
+        self._length = 0
+
+    def _add(self, phase, steps, changes):
+        state = {**self.state, **changes}
+        self._segments.append((phase, steps, state))
+        self._starts.append(self._length)
+        self._length += len(steps)
+        # Later segments start from where the tween ended
+        self.state = self._frame(phase, state, steps[-1]) if steps else state
+        del self.state['phase']
+
+    def hold(self, phase, frames, **changes):
+        """Show the state, updated with `changes`, for `frames` frames"""
+        self._add(phase, range(frames), changes)
+
+    def tween(self, phase, steps, **changes):
+        """One frame per value in `steps`; callable changes are evaluated with that value"""
+        self._add(phase, steps, changes)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        segment = bisect.bisect_right(self._starts, index) - 1
+        phase, steps, state = self._segments[segment]
+        return self._frame(phase, state, steps[index - self._starts[segment]])
+
+    def __iter__(self):
+        for phase, steps, state in self._segments:
+            for step in steps:
+                yield self._frame(phase, state, step)
+
+    @staticmethod
+    def _frame(phase, state, step):
+        frame = {'phase': phase}
+        for key, value in state.items():
+            frame[key] = value(step) if callable(value) else value
+        return frame
 
 # Cell dimensions (wider to span entire Excel window)
 cell_w = 100
@@ -378,509 +1833,761 @@ cell_h = 38
 start_x = excel_x + 50  # Start after row numbers column
 start_y = excel_y + excel_h - header_h - 25  # Top data row
 
-# Years
-years = ['2025A', '2026E', '2027E', '2028E', '2029E']
-
-# Data
-projection_data = {
-    'Revenue': [394, 412, 430, 445, 459],
-    'FCF': [126, 135, 142, 148, 154],
-}
+# The company being valued
+company = APPLE
 
-# --- PHASE 1: User Input (0-30 frames) ---
 input_text = "Perform a DCF analysis on Apple"
 apple_typed_index = input_text.lower().find("apple") + len("apple")  # Show after "Apple" is typed
-for i in range(0, len(input_text) + 1, 2):
-    frames.append({
-        'phase': 'input_typing',
-        'input_text': input_text[:min(i, len(input_text))],
-        'show_cursor': i < len(input_text),
-        'show_file_attachment': i >= apple_typed_index,
-        'chat_messages': [],
-        'excel_content': [],
-    })
+first_response = "Researching assumptions online..."
+second_response = "Extracting financials from PDF..."
+third_response = "Building Excel formulas..."
+enterprise_formula = "=PV(C4, 5, 0, -G9 * C3) + NPV(C4, C9:G9)"
 
+user_message = {'text': input_text, 'is_user': True, 'order': 0}
+
+def bot_message(text, order, final_text=None):
+    return {'text': text, 'is_user': False, 'order': order, 'final_text': final_text or text}
+
+def streamed_reply(messages, text, order):
+    """Tween: `messages` followed by a bot reply streamed up to n characters"""
+    return lambda n: messages + (bot_message(text[:n], order, final_text=text),)
+
+def formula_typed(cells, ref, formula):
+    """Tween: `cells` plus `formula` typed into `ref` up to n characters"""
+    return lambda n: cells + ((ref, Cell(formula[:n], style='formula', formula=formula)),)
+
+# Cumulative chat transcript
+chat_1 = (user_message, bot_message(first_response, 1))
+chat_2 = chat_1 + (bot_message(second_response, 2),)
+chat_3 = chat_2 + (bot_message(third_response, 3),)
+
+# Cumulative sheet contents, as (A1 address, Cell) pairs
+data_columns = COL_LETTERS[2:2 + len(company.years)]
+assumptions = (
+    ('A2', Cell('Major Assumptions', style='section')),
+    ('A3', Cell('Terminal Multiple', style='label')),
+    ('C3', Cell(company.terminal_multiple, '{:g}x', 'input')),
+    ('A4', Cell('Discount Rate', style='label')),
+    ('C4', Cell(company.discount_rate, '{:.0%}', 'input')),
+)
+projections = assumptions + (
+    ('A7', Cell('Projections', style='heading')),
+    *((f'{col}7', Cell(year, style='year')) for col, year in zip(data_columns, company.years)),
+    ('A8', Cell('Revenue', style='label')),
+    *((f'{col}8', Cell(value, '{}B')) for col, value in zip(data_columns, company.revenue)),
+    ('A9', Cell('FCF', style='label')),
+    *((f'{col}9', Cell(value, '{}B')) for col, value in zip(data_columns, company.fcf)),
+)
+enterprise_value_label = projections + (('A12', Cell('Enterprise Value', style='total')),)
+# What the formula evaluates to for the assumptions above
+base_value = float(enterprise_value(company.fcf, company.discount_rate, company.terminal_multiple))
+valuation = enterprise_value_label + (('C12', Cell(base_value, 'billions', 'result', enterprise_formula)),)
+
+timeline = Timeline(input_text='', show_cursor=False, show_file_attachment=True, chat_messages=(), sheet=())
+
+# --- PHASE 1: User Input ---
+timeline.tween('input_typing', range(0, len(input_text) + 1, 2),
+               input_text=lambda n: input_text[:n],
+               show_cursor=lambda n: n < len(input_text),
+               show_file_attachment=lambda n: n >= apple_typed_index)
 # Brief pause
-for i in range(2):
-    frames.append({
-        'phase': 'input_pause',
-        'input_text': input_text,
-        'show_cursor': False,
-        'show_file_attachment': True,
-        'chat_messages': [],
-        'excel_content': [],
-    })
-
-# --- PHASE 2: User Message Sent, First Bot Response (33-100) ---
-for i in range(5):
-    frames.append({
-        'phase': 'message_sent',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0}
-        ],
-        'excel_content': [],
-    })
+timeline.hold('input_pause', 2, input_text=input_text, show_cursor=False, show_file_attachment=True)
 
+# --- PHASE 2: User Message Sent, First Bot Response ---
+timeline.hold('message_sent', 5, input_text='', chat_messages=(user_message,))
 # First bot message streams
-first_response = "Researching assumptions online..."
-first_response_height = 55  # Shorter text, no wrapping needed
-for i in range(5, len(first_response) + 1, 10):
-    frames.append({
-        'phase': 'bot_responding',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response[:min(i, len(first_response))], 'is_user': False, 'order': 1, 'final_height': first_response_height}
-        ],
-        'excel_content': [],
-    })
-
+timeline.tween('bot_responding', range(5, len(first_response) + 1, 10),
+               chat_messages=streamed_reply((user_message,), first_response, 1))
 # Pause after first bot response
-for i in range(6):
-    frames.append({
-        'phase': 'bot_complete',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height}
-        ],
-        'excel_content': [],
-    })
+timeline.hold('bot_complete', 6, chat_messages=chat_1)
 
 # --- PHASE 3: Basic Assumptions in Excel ---
-# All assumptions appear at once
-for i in range(1):
-    frames.append({
-        'phase': 'excel_assumptions',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2}
-        ],
-    })
-
-# Pause after assumptions section complete
-for i in range(6):
-    frames.append({
-        'phase': 'excel_assumptions',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2}
-        ],
-    })
-
-# --- PHASE 4: Second Bot Response (155-195) ---
-second_response = "Extracting financials from PDF..."
-second_response_height = 55  # Shorter text, no wrapping needed
-
-for i in range(5, len(second_response) + 1, 10):
-    frames.append({
-        'phase': 'bot_responding',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response[:min(i, len(second_response))], 'is_user': False, 'order': 2, 'final_height': second_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2}
-        ],
-    })
-
-# Pause after second bot response
-for i in range(6):
-    frames.append({
-        'phase': 'bot_complete',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response, 'is_user': False, 'order': 2, 'final_height': second_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2}
-        ],
-    })
+# All assumptions appear at once, then pause
+timeline.hold('excel_assumptions', 1 + 6, sheet=assumptions)
+
+# --- PHASE 4: Second Bot Response ---
+timeline.tween('bot_responding', range(5, len(second_response) + 1, 10),
+               chat_messages=streamed_reply(chat_1, second_response, 2))
+timeline.hold('bot_complete', 6, chat_messages=chat_2)
 
 # --- PHASE 5: Projections in Excel ---
 # All financials appear at once
-for i in range(1):
-    frames.append({
-        'phase': 'excel_projections',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response, 'is_user': False, 'order': 2, 'final_height': second_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2},
-            {'type': 'projections', 'year_count': len(years), 'data_rows': 2, 'revenue_cells': len(years), 'fcf_cells': len(years)}
-        ],
-    })
-
+timeline.hold('excel_projections', 1, sheet=projections)
 # Pause after projections section complete
-for i in range(6):
-    frames.append({
-        'phase': 'excel_complete',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response, 'is_user': False, 'order': 2, 'final_height': second_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2},
-            {'type': 'projections', 'year_count': len(years), 'data_rows': 2, 'revenue_cells': len(years), 'fcf_cells': len(years)}
-        ],
-    })
-
-# --- PHASE 6: Third Bot Response (280-320) ---
-third_response = "Building Excel formulas..."
-third_response_height = 55  # Shorter text, no wrapping needed
-
-for i in range(5, len(third_response) + 1, 10):
-    frames.append({
-        'phase': 'bot_responding',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response, 'is_user': False, 'order': 2, 'final_height': second_response_height},
-            {'text': third_response[:min(i, len(third_response))], 'is_user': False, 'order': 3, 'final_height': third_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2},
-            {'type': 'projections', 'year_count': len(years), 'data_rows': 2, 'revenue_cells': len(years), 'fcf_cells': len(years)}
-        ],
-    })
-
-# Pause after third bot response
-for i in range(6):
-    frames.append({
-        'phase': 'bot_complete',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response, 'is_user': False, 'order': 2, 'final_height': second_response_height},
-            {'text': third_response, 'is_user': False, 'order': 3, 'final_height': third_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2},
-            {'type': 'projections', 'year_count': len(years), 'data_rows': 2, 'revenue_cells': len(years), 'fcf_cells': len(years)}
-        ],
-    })
-
-# --- PHASE 7: Terminal Value & PV Calculations (330-420) ---
-# Terminal Multiple appears
-for step in range(4):
-    frames.append({
-        'phase': 'excel_formulas',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response, 'is_user': False, 'order': 2, 'final_height': second_response_height},
-            {'text': third_response, 'is_user': False, 'order': 3, 'final_height': third_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2},
-            {'type': 'projections', 'year_count': len(years), 'data_rows': 2, 'revenue_cells': len(years), 'fcf_cells': len(years)},
-            {'type': 'formulas', 'formula_step': step}
-        ],
-    })
-
-# Pause with Terminal Value and PV of FCF values appearing
-for step in range(4):
-    frames.append({
-        'phase': 'excel_formulas',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response, 'is_user': False, 'order': 2, 'final_height': second_response_height},
-            {'text': third_response, 'is_user': False, 'order': 3, 'final_height': third_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2},
-            {'type': 'projections', 'year_count': len(years), 'data_rows': 2, 'revenue_cells': len(years), 'fcf_cells': len(years)},
-            {'type': 'formulas', 'formula_step': 5}
-        ],
-    })
-
-
-# Enterprise Value formula types out (1 frame per 2 characters)
-enterprise_formula = "=PV(C4, 5, 0, -G9 * C3) + NPV(C4, C9:G9)"
-for i in range(0, len(enterprise_formula) + 1, 10):
-    frames.append({
-        'phase': 'excel_formulas',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response, 'is_user': False, 'order': 2, 'final_height': second_response_height},
-            {'text': third_response, 'is_user': False, 'order': 3, 'final_height': third_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2},
-            {'type': 'projections', 'year_count': len(years), 'data_rows': 2, 'revenue_cells': len(years), 'fcf_cells': len(years)},
-            {'type': 'formulas', 'formula_step': 6, 'enterprise_formula_progress': min(i, len(enterprise_formula))}
-        ],
-    })
-
-# Pause on complete formula so viewer can read it (1 second at 8fps)
-for i in range(8):
-    frames.append({
-        'phase': 'excel_formulas',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response, 'is_user': False, 'order': 2, 'final_height': second_response_height},
-            {'text': third_response, 'is_user': False, 'order': 3, 'final_height': third_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2},
-            {'type': 'projections', 'year_count': len(years), 'data_rows': 2, 'revenue_cells': len(years), 'fcf_cells': len(years)},
-            {'type': 'formulas', 'formula_step': 6, 'enterprise_formula_progress': len(enterprise_formula)}
-        ],
-    })
-
-# Pause on final formula before it converts to value (longer pause to see complete formula)
-for i in range(25):
-    frames.append({
-        'phase': 'excel_formulas',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response, 'is_user': False, 'order': 2, 'final_height': second_response_height},
-            {'text': third_response, 'is_user': False, 'order': 3, 'final_height': third_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2},
-            {'type': 'projections', 'year_count': len(years), 'data_rows': 2, 'revenue_cells': len(years), 'fcf_cells': len(years)},
-            {'type': 'formulas', 'formula_step': 7}
-        ],
-    })
-
-# --- PHASE 8: Enterprise Value Final (445-480) ---
-# Enterprise Value formula and execution (without the formulas overlay)
-for step in range(2):
-    frames.append({
-        'phase': 'excel_final',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response, 'is_user': False, 'order': 2, 'final_height': second_response_height},
-            {'text': third_response, 'is_user': False, 'order': 3, 'final_height': third_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2},
-            {'type': 'projections', 'year_count': len(years), 'data_rows': 2, 'revenue_cells': len(years), 'fcf_cells': len(years)},
-            {'type': 'final', 'step': step}
-        ],
-    })
-
+timeline.hold('excel_complete', 6)
+
+# --- PHASE 6: Third Bot Response ---
+timeline.tween('bot_responding', range(5, len(third_response) + 1, 10),
+               chat_messages=streamed_reply(chat_2, third_response, 3))
+timeline.hold('bot_complete', 6, chat_messages=chat_3)
+
+# --- PHASE 7: Terminal Value & PV Calculations ---
+# Enterprise Value label appears
+timeline.hold('excel_formulas', 3)
+timeline.hold('excel_formulas', 1 + 4, sheet=enterprise_value_label)
+# Enterprise Value formula types out (1 frame per 10 characters)
+timeline.tween('excel_formulas', range(0, len(enterprise_formula) + 1, 10),
+               sheet=formula_typed(enterprise_value_label, 'C12', enterprise_formula))
+# Pause on complete formula so viewer can read it
+timeline.hold('excel_formulas', 8)
+# Formula converts to its value (longer pause to see the result)
+timeline.hold('excel_formulas', 25, sheet=valuation)
+
+# --- PHASE 8: Enterprise Value Final ---
+timeline.hold('excel_final', 2)
 # Hold with final result (longer pause for user to read)
-for i in range(25):
-    frames.append({
-        'phase': 'hold',
-        'input_text': '',
-        'chat_messages': [
-            {'text': 'Perform a DCF analysis on Apple', 'is_user': True, 'order': 0},
-            {'text': first_response, 'is_user': False, 'order': 1, 'final_height': first_response_height},
-            {'text': second_response, 'is_user': False, 'order': 2, 'final_height': second_response_height},
-            {'text': third_response, 'is_user': False, 'order': 3, 'final_height': third_response_height}
-        ],
-        'excel_content': [
-            {'type': 'assumptions', 'rows': 2},
-            {'type': 'projections', 'year_count': len(years), 'data_rows': 2, 'revenue_cells': len(years), 'fcf_cells': len(years)},
-            {'type': 'final', 'step': 2}
-        ],
-    })
+timeline.hold('hold', 25)
 
 def update(frame_data):
-    ax.clear()
-    ax.set_xlim(0, 1400)
-    ax.set_ylim(0, 700)
-    ax.axis('off')
-
-    draw_ui_layout()
-
-    # --- Draw Input Box ---
-    if frame_data.get('input_text'):
-        draw_input_placeholder(frame_data['input_text'], frame_data.get('show_cursor', False))
-
-    # --- Draw File Attachment indicator (show after "Apple" is typed) ---
-    if frame_data.get('show_file_attachment', True):
-        draw_file_attachment()
-
-    # --- Draw Chat Messages (top to bottom) ---
-    chat_messages = frame_data.get('chat_messages', [])
-    chat_start_y = chat_y + chat_h - header_h - 90  # Start position for first message (70 + 20px spacing above)
-
-    for msg in sorted(chat_messages, key=lambda m: m.get('order', 0)):
-        if msg['is_user']:
-            draw_user_message(msg['text'], chat_start_y)
-            chat_start_y -= 105  # User bubble height (65) + 40px spacing
-        else:
-            # Use pre-calculated final_height if available
-            final_height = msg.get('final_height', 55)
-            draw_bot_message(msg['text'], chat_start_y, final_height=final_height)
-            chat_start_y -= final_height + 40  # Bot message height + 40px spacing
-
+    scene.begin_frame()
+
+    with scene.layer('chrome'), scene.static():
+        draw_ui_layout()
+
+    # --- Chat transcript layer ---
+    with scene.layer('chat'):
+        # --- Draw Input Box ---
+        if frame_data.get('input_text'):
+            draw_input_placeholder(frame_data['input_text'], frame_data.get('show_cursor', False))
+
+        # --- Draw File Attachment indicator (show after "Apple" is typed) ---
+        if frame_data.get('show_file_attachment', True):
+            draw_file_attachment()
+
+        # --- Draw Chat Messages (top to bottom) ---
+        chat_messages = frame_data.get('chat_messages', [])
+        # Top of the next message; messages stack downward from below the header
+        chat_start_y = chat_y + chat_h - header_h - 35
+
+        for msg in sorted(chat_messages, key=lambda m: m.get('order', 0)):
+            if msg['is_user']:
+                bubble_h = draw_user_message(msg['text'], chat_start_y, key=('msg', msg.get('order', 0)))
+                chat_start_y -= bubble_h + 50  # User bubble height + 50px spacing
+            else:
+                # Sized for the complete reply, so messages below don't move while it streams
+                bubble_h = draw_bot_message(msg['text'], chat_start_y, final_text=msg.get('final_text'), key=('msg', msg.get('order', 0)))
+                chat_start_y -= bubble_h + 40  # Bot message height + 40px spacing
+
+    # --- Excel sheet layer (the default) ---
     # --- Draw Excel Grid Background ---
-    draw_excel_grid()
-
-    # --- Draw Excel Content (cumulative) ---
-    excel_content = frame_data.get('excel_content', [])
-    current_excel_y = start_y
-
-    for content in excel_content:
-        content_type = content.get('type')
-
-        if content_type == 'assumptions':
-            # Draw assumptions section
-            rows_shown = content.get('rows', 0)
-
-            # Blank row at top
-            draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, '', 'white', fontsize=8)
-            current_excel_y -= cell_h + 1
-
-            # Header: Major Assumptions (always bold)
-            draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, 'Major Assumptions', '#e8e8e8', fontsize=8, fontweight='bold', align='left')
-            current_excel_y -= cell_h + 1
-
-            # Row 1: Terminal Multiple (moved from row 12)
-            if rows_shown >= 1:
-                draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, 'Terminal Multiple', '#f5f5f5', fontsize=8, align='left')
-                draw_excel_cell(start_x + cell_w * 2, current_excel_y, cell_w, cell_h, '10x', '#f5f5f5', text_color='#0d6efd', fontsize=9)
-                current_excel_y -= cell_h + 1
-
-            # Row 2: Discount Rate
-            if rows_shown >= 2:
-                draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, 'Discount Rate', 'white', fontsize=8, align='left')
-                draw_excel_cell(start_x + cell_w * 2, current_excel_y, cell_w, cell_h, '8%', 'white', text_color='#0d6efd', fontsize=9)
-                current_excel_y -= cell_h + 1
-
-                # Blank row after Discount Rate
-                draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, '', '#f5f5f5', fontsize=8)
-                current_excel_y -= cell_h + 1
-
-                # Second blank row before Projections
-                draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, '', 'white', fontsize=8)
-                current_excel_y -= cell_h + 1
-
-        elif content_type == 'projections':
-            # Draw projections section
-            year_count = content.get('year_count', 0)
-            data_rows = content.get('data_rows', 0)
-
-            # Section header (always bold)
-            draw_section_header(start_x, current_excel_y, cell_w, cell_h, 'Projections', fontweight='bold')
-            for i in range(year_count):
-                draw_excel_header_cell(start_x + cell_w * 2 + i * cell_w, current_excel_y, cell_w, cell_h, years[i], bg_color='#1e5a96', text_color='white')
-            current_excel_y -= cell_h + 1
-
-            # Revenue row
-            if data_rows >= 1:
-                draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, 'Revenue', '#f5f5f5', fontsize=8, align='left')
-                revenue_cells = content.get('revenue_cells', 0)
-                for i in range(min(revenue_cells, len(years))):
-                    draw_excel_cell(start_x + cell_w * 2 + i * cell_w, current_excel_y, cell_w, cell_h, f"{projection_data['Revenue'][i]}B", '#f5f5f5', fontsize=8)
-                current_excel_y -= cell_h + 1
-
-            # FCF row
-            if data_rows >= 2:
-                draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, 'FCF', 'white', fontsize=8, align='left')
-                fcf_cells = content.get('fcf_cells', 0)
-                for i in range(min(fcf_cells, len(years))):
-                    draw_excel_cell(start_x + cell_w * 2 + i * cell_w, current_excel_y, cell_w, cell_h, f"{projection_data['FCF'][i]}B", 'white', fontsize=8)
-                current_excel_y -= cell_h + 1
-
-        elif content_type == 'formulas':
-            # Draw formula section
-            formula_step = content.get('formula_step', 0)
-
-            # Two blank rows before Enterprise Value (rows 10-11)
-            draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, '', '#f5f5f5', fontsize=8)
-            current_excel_y -= cell_h + 1
-            draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, '', 'white', fontsize=8)
-            current_excel_y -= cell_h + 1
-
-            # Enterprise Value row (row 12)
-            if formula_step >= 3:
-                draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, 'Enterprise Value', '#fff3cd', fontsize=8, fontweight='bold', align='left')
-                # Show formula as it types out character by character
-                if formula_step == 6:
-                    enterprise_formula = "=PV(C4, 5, 0, -G9 * C3) + NPV(C4, C9:G9)"
-                    progress = content.get('enterprise_formula_progress', 0)
-                    partial_formula = enterprise_formula[:progress]
-                    # Draw white background to cover cell borders as formula expands
-                    formula_bg = patches.Rectangle((start_x + cell_w * 2, current_excel_y), cell_w * 5, cell_h,
-                                                   facecolor='white', edgecolor='none', zorder=2)
-                    ax.add_patch(formula_bg)
-                    # Draw formula with colored cell references
-                    draw_colored_formula(ax, start_x + cell_w * 2 + 5, current_excel_y + cell_h/2, partial_formula, fontsize=9)
-                    # Draw colored outlines on referenced cells
-                    draw_cell_reference_highlights(ax, partial_formula, start_x, start_y, cell_w, cell_h)
-                elif formula_step >= 7:
-                    # Show calculated value (no cell highlights, black bold text)
-                    draw_excel_cell(start_x + cell_w * 2, current_excel_y, cell_w, cell_h, '$2.1T', 'white', text_color='#212529', fontsize=8, fontweight='bold', highlight=False, fontfamily='sans-serif')
-
-        elif content_type == 'final':
-            # Draw final result (all calculations complete)
-            # Two blank rows before Enterprise Value (rows 10-11)
-            draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, '', '#f5f5f5', fontsize=8)
-            current_excel_y -= cell_h + 1
-            draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, '', 'white', fontsize=8)
-            current_excel_y -= cell_h + 1
-
-            # Enterprise Value row (row 12, always bold)
-            draw_excel_cell(start_x, current_excel_y, cell_w, cell_h, 'Enterprise Value', '#fff3cd', fontsize=8, fontweight='bold', align='left')
-            draw_excel_cell(start_x + cell_w * 2, current_excel_y, cell_w, cell_h, '$2.1T', 'white', text_color='#212529', fontsize=8, fontweight='bold', highlight=False, fontfamily='sans-serif')
-
-# Generate animation
-ani = FuncAnimation(fig, update, frames=frames, interval=67, repeat=True)
-
-# Save as MP4 (primary format - crisp, small file)
-from matplotlib.animation import FFMpegWriter
-mp4_writer = FFMpegWriter(fps=10, codec='libx264', extra_args=['-pix_fmt', 'yuv420p', '-crf', '23'])
-import os
-
-# Output directly to public/images/ for the website
-output_dir = os.path.normpath(os.path.join(os.path.dirname(__file__), '..', '..', 'public', 'images'))
-os.makedirs(output_dir, exist_ok=True)
-
-mp4_path = os.path.join(output_dir, 'dcf_apple_demo.mp4')
-gif_path = os.path.join(output_dir, 'dcf_apple_demo.gif')
-png_path = os.path.join(output_dir, 'dcf_apple_demo_final.png')
-
-ani.save(mp4_path, writer=mp4_writer)
-
-# Save as GIF (fallback)
-ani.save(gif_path, writer=PillowWriter(fps=10))
-
-# Generate final frame as PNG
-update(frames[-1])
-plt.savefig(png_path, dpi=150, bbox_inches='tight', facecolor='#ffffff')
-plt.close()
-
-mp4_size = os.path.getsize(mp4_path) / 1024
-gif_size = os.path.getsize(gif_path) / 1024
-print(f"✓ MP4: {mp4_path} ({mp4_size:.0f}KB)")
-print(f"✓ GIF: {gif_path} ({gif_size:.0f}KB)")
-print(f"✓ Total frames: {len(frames)}")
-print(f"✓ Duration: ~{len(frames) / 10:.1f} seconds at 10fps")
-print(f"✓ Final frame saved as: {png_path}")
+    with scene.static():
+        draw_excel_grid()
+
+    # --- Draw Excel Content (only the cells that changed) ---
+    sheet.update(frame_data.get('sheet', ()))
+    sheet.draw()
+
+    scene.end_frame()
+
+# --- Profiling ---
+# Off by default: the hooks below are only installed with --profile or
+# $DCF_PROFILE, so a normal build runs the plain functions.
+
+class DrawProfiler:
+    """Calls, artists created and time of the draw_* helpers, per timeline phase
+
+    Times in `stats` include nested draw_* calls. `folded` holds exclusive
+    time per call stack in microseconds, the folded format flamegraph.pl reads.
+    """
+
+    def __init__(self):
+        self.phase = None
+        self.frames = collections.Counter()  # phase -> frames rendered
+        self.stats = collections.defaultdict(lambda: [0, 0, 0.0])  # (phase, name) -> [calls, created, seconds]
+        self.folded = collections.Counter()
+        self._stack = []  # [name, seconds spent in nested calls]
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def profiled(*args, **kwargs):
+            self._stack.append([name, 0.0])
+            created = scene.artist_count
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                _, nested = self._stack.pop()
+                stats = self.stats[self.phase, name]
+                stats[0] += 1
+                stats[1] += scene.artist_count - created
+                stats[2] += elapsed
+                stack = ';'.join([str(self.phase)] + [caller for caller, _ in self._stack] + [name])
+                self.folded[stack] += (elapsed - nested) * 1e6
+                if self._stack:
+                    self._stack[-1][1] += elapsed
+        return profiled
+
+    def report(self):
+        for phase, frames in self.frames.items():
+            print(f"  {phase} ({frames} frames rendered)")
+            rows = [(name, stats) for (p, name), stats in self.stats.items() if p == phase]
+            for name, (calls, created, seconds) in sorted(rows, key=lambda row: -row[1][2]):
+                print(f"    {name:<32} {calls:>6} calls {created:>5} created {1000 * seconds / frames:>8.2f} ms/frame")
+
+    def dump_folded(self, path):
+        with open(path, 'w') as f:
+            for stack, micros in self.folded.items():
+                f.write(f"{stack} {round(micros)}\n")
+
+def install_profiler():
+    """Wrap update(), scene.render() and every draw_* helper with a DrawProfiler
+
+    update() and the helpers look each other up as globals at call time, so
+    replacing the globals is enough.
+    """
+    profiler = DrawProfiler()
+    module = globals()
+    for name, func in list(module.items()):
+        if name.startswith('draw_') and callable(func):
+            module[name] = profiler.wrap(name, func)
+    profiled_update = profiler.wrap('update', update)
+
+    def update_frame(frame_data):
+        profiler.phase = frame_data.get('phase')
+        profiler.frames[profiler.phase] += 1
+        return profiled_update(frame_data)
+
+    module['update'] = update_frame
+    scene.render = profiler.wrap('render', scene.render)
+    return profiler
+
+# --- Export ---
+# Every frame is rasterized once and the same RGBA buffer is handed to each
+# output sink, instead of re-running update() for every output format. Runs of
+# identical frame specs (holds and pauses) are rendered once and written with
+# a repeat count.
+
+# Software encoder settings for the MP4, selected with --preset
+MP4_PRESETS = {
+    'web': ['-vcodec', 'libx264', '-pix_fmt', 'yuv420p', '-crf', '23'],
+    'web-small': ['-vcodec', 'libx264', '-preset', 'veryslow', '-tune', 'animation', '-pix_fmt', 'yuv420p',
+                  '-crf', '28', '-movflags', '+faststart'],
+    'draft': ['-vcodec', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', '-crf', '30'],
+    # Lossless: encoded as RGB, so there is no chroma subsampling either
+    'archival': ['-vcodec', 'libx264rgb', '-preset', 'veryslow', '-crf', '0', '-pix_fmt', 'rgb24'],
+}
+# Smaller formats for browsers that support them
+VP9_ARGS = ['-vcodec', 'libvpx-vp9', '-pix_fmt', 'yuv420p', '-crf', '40', '-b:v', '0',
+            '-deadline', 'good', '-cpu-used', '4', '-row-mt', '1']
+AV1_ARGS = ['-vcodec', 'libaom-av1', '-pix_fmt', 'yuv420p', '-crf', '34', '-b:v', '0', '-cpu-used', '6', '-row-mt', '1']
+WEBP_ARGS = ['-vcodec', 'libwebp_anim', '-lossless', '0', '-quality', '80', '-preset', 'drawing', '-loop', '0']
+
+def decode_frames(path, fps, shape):
+    """Yield the (height, width, 3) RGB frames of an encoded animation at `fps`"""
+    if path.endswith(('.gif', '.webp')):
+        # ffmpeg can't decode animated WebP; Pillow composites both formats
+        with Image.open(path) as image:
+            for index in range(getattr(image, 'n_frames', 1)):
+                image.seek(index)
+                image.load()
+                rgb = np.asarray(image.convert('RGB'))
+                for _ in range(max(1, round(image.info.get('duration', 1000 / fps) * fps / 1000))):
+                    yield rgb
+        return
+    cmd = [mpl.rcParams['animation.ffmpeg_path'], '-loglevel', 'error', '-i', path,
+           '-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:']
+    size = shape[0] * shape[1] * 3
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE) as proc:
+        while len(data := proc.stdout.read(size)) == size:
+            yield np.frombuffer(data, np.uint8).reshape(shape[0], shape[1], 3)
+
+@functools.lru_cache(maxsize=None)
+def ffmpeg_encoders():
+    """Names of the encoders the ffmpeg binary was built with"""
+    result = subprocess.run([mpl.rcParams['animation.ffmpeg_path'], '-hide_banner', '-encoders'],
+                            capture_output=True, text=True)
+    # Encoders are listed as ' V....D name  description' after a '------' line
+    listing = result.stdout.partition('------')[2]
+    return {line.split()[1] for line in listing.splitlines() if len(line.split()) > 1}
+
+class EncodedSink:
+    """Base for sinks that encode every frame; keeps samples to measure quality
+
+    Every `sample_every`-th output frame is kept, and once the file is
+    written psnr() decodes it again and compares those frames.
+    """
+
+    sample_every = 10
+
+    def __init__(self, path, fps):
+        self.path = path
+        self.fps = fps
+        self.frames = 0
+        self.samples = {}
+
+    def _sample(self, frame, repeat):
+        first = self.frames + -self.frames % self.sample_every
+        if first < self.frames + repeat:
+            rgb = frame[..., :3].copy()
+            for index in range(first, self.frames + repeat, self.sample_every):
+                self.samples[index] = rgb
+        self.frames += repeat
+
+    def psnr(self):
+        """Mean PSNR in dB of the sampled frames against the written file, or None if none decode"""
+        if not self.samples:
+            return None
+        shape = next(iter(self.samples.values())).shape
+        scores = []
+        for index, decoded in enumerate(decode_frames(self.path, self.fps, shape)):
+            if index in self.samples:
+                mse = np.mean((decoded.astype(np.float64) - self.samples[index]) ** 2)
+                scores.append(10 * np.log10(255 ** 2 / mse) if mse else float('inf'))
+        return np.mean(scores) if scores else None
+
+class FFmpegSink(EncodedSink):
+    """Pipe raw RGBA frames into an ffmpeg subprocess
+
+    Frames are written to ffmpeg's stdin straight from their buffer, without
+    copying. `seconds` is the time spent waiting on ffmpeg, for reporting the
+    encode rate. If ffmpeg fails, the remaining frames are dropped and
+    `error` says why once the sink is closed, so other outputs still finish.
+    """
+
+    def __init__(self, path, fps, output_args):
+        super().__init__(path, fps)
+        self.output_args = output_args
+        self.seconds = 0.0
+        self.error = None
+        self._proc = None
+
+    @property
+    def encoder(self):
+        """The ffmpeg encoder this output needs"""
+        return self.output_args[self.output_args.index('-vcodec') + 1]
+
+    def write(self, frame, repeat=1):
+        start = time.perf_counter()
+        if self._proc is not None and self._proc.poll() is not None:
+            return
+        self._sample(frame, repeat)
+        if self._proc is None:
+            height, width, channels = frame.shape
+            pix_fmt = 'rgba' if channels == 4 else 'rgb24'
+            cmd = [mpl.rcParams['animation.ffmpeg_path'], '-f', 'rawvideo', '-vcodec', 'rawvideo',
+                   '-s', f'{width}x{height}', '-pix_fmt', pix_fmt, '-framerate', str(self.fps),
+                   '-loglevel', 'error', '-i', 'pipe:', *self.output_args, '-y', self.path]
+            self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+        # Canvas frames are contiguous, so this is a view of the buffer itself
+        data = memoryview(np.ascontiguousarray(frame)).cast('B')
+        try:
+            for _ in range(repeat):
+                self._proc.stdin.write(data)
+        except BrokenPipeError:
+            # ffmpeg has exited; close() collects its status
+            pass
+        self.seconds += time.perf_counter() - start
+
+    def close(self):
+        start = time.perf_counter()
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self._proc.wait() != 0:
+            self.error = f"ffmpeg exited with status {self._proc.returncode}"
+        self.seconds += time.perf_counter() - start
+
+    @property
+    def fps_encoded(self):
+        return self.frames / self.seconds if self.seconds else float('inf')
+
+# Spreadsheet colors drawn with literals rather than design tokens
+SHEET_COLORS = ['#212529', '#f5f5f5', '#e8e8e8', '#e0e0e0', '#d3d3d3', '#b0b0b0', '#999999',
+                '#fff3cd', '#0d6efd', '#1e5a96', '#2d6a4f', '#d9534f']
+GIF_TRANSPARENT = 255
+
+def design_palette(steps=6):
+    """Up to 255 RGB colors: the design colors plus their anti-aliasing ramps
+
+    Every foreground color gets `steps` blends toward white, the page
+    background, and a midpoint blend over each of the other light backgrounds.
+    """
+    tokens = [value for name, value in globals().items() if name.startswith('COLOR_')]
+    colors = [np.array(mpl.colors.to_rgb(c)) * 255 for c in tokens + REF_COLORS + SHEET_COLORS]
+    light = [c for c in colors if c @ [0.299, 0.587, 0.114] > 0.85 * 255]
+    dark = [c for c in colors if c @ [0.299, 0.587, 0.114] <= 0.85 * 255]
+    white = np.full(3, 255.0)
+    ramps = [fg + (white - fg) * t for fg in dark for t in np.arange(1, steps + 1) / (steps + 1)]
+    ramps += [(fg + bg) / 2 for fg in dark for bg in light]
+    palette = np.rint([white] + colors + ramps).astype(np.uint8)
+    # Drop duplicates, keeping the first (most important) occurrence
+    _, first = np.unique(palette, axis=0, return_index=True)
+    return palette[np.sort(first)][:GIF_TRANSPARENT]
+
+class GifSink(EncodedSink):
+    """Stream an animated GIF with one global palette built from the design colors
+
+    After the first frame only the bounding box of changed pixels is stored,
+    with the unchanged pixels inside it transparent. A frame identical to the
+    previous one just extends its duration. Colors off the palette map to
+    the nearest entry.
+    """
+
+    def __init__(self, path, fps):
+        super().__init__(path, fps)
+        self._palette = design_palette().astype(np.int32)
+        self._palette_bytes = self._palette.astype(np.uint8).tobytes().ljust(768, b'\0')
+        self._nearest = {}  # packed RGB -> palette index
+        self._file = None
+        self._previous = None
+        self._pending = None  # (image, offset, transparent, duration) not written yet
+
+    def _indices(self, rgb):
+        packed = (rgb[..., 0].astype(np.uint32) << 16) | (rgb[..., 1].astype(np.uint32) << 8) | rgb[..., 2]
+        colors, inverse = np.unique(packed, return_inverse=True)
+        new = [color for color in colors.tolist() if color not in self._nearest]
+        if new:
+            new_rgb = (np.array(new)[:, None] >> [16, 8, 0]) & 0xff
+            distance = ((new_rgb[:, None, :] - self._palette[None]) ** 2).sum(axis=2)
+            self._nearest.update(zip(new, distance.argmin(axis=1).tolist()))
+        lookup = np.array([self._nearest[color] for color in colors.tolist()], dtype=np.uint8)
+        return lookup[inverse].reshape(rgb.shape[:2])
+
+    def write(self, frame, repeat=1):
+        self._sample(frame, repeat)
+        rgb = frame[..., :3]
+        duration = 1000 * repeat / self.fps
+        if self._previous is None:
+            r0, c0, r1, c1 = 0, 0, *rgb.shape[:2]
+        else:
+            changed = (rgb != self._previous).any(axis=2)
+            rows = np.flatnonzero(changed.any(axis=1))
+            if not len(rows):
+                self._pending[3] += duration
+                return
+            cols = np.flatnonzero(changed.any(axis=0))
+            r0, c0, r1, c1 = rows[0], cols[0], rows[-1] + 1, cols[-1] + 1
+        self._flush()
+
+        indices = self._indices(rgb[r0:r1, c0:c1])
+        if self._previous is not None:
+            indices[~changed[r0:r1, c0:c1]] = GIF_TRANSPARENT
+        image = Image.fromarray(indices, 'P')
+        image.putpalette(self._palette_bytes)
+        self._pending = [image, (int(c0), int(r0)), self._previous is not None, duration]
+        # Frames may be views of the reused canvas buffer
+        self._previous = rgb.copy()
+
+    def _flush(self):
+        if self._pending is None:
+            return
+        image, offset, transparent, duration = self._pending
+        if self._file is None:
+            self._file = open(self.path, 'wb')
+            header, _ = GifImagePlugin.getheader(image, info={'loop': 0})
+            self._file.writelines(header)
+        params = dict(duration=round(duration), disposal=1)
+        if transparent:
+            params['transparency'] = GIF_TRANSPARENT
+        self._file.writelines(GifImagePlugin.getdata(image, offset, **params))
+        self._pending = None
+
+    def close(self):
+        self._flush()
+        self._file.write(b';')
+        self._file.close()
+
+class PngSink:
+    """Save the last frame as a still image"""
+
+    def __init__(self, path, dpi=150):
+        self.path = path
+        self.dpi = dpi
+        # Matches the 0.1in pad savefig(bbox_inches='tight') used to add
+        self.pad = round(0.1 * dpi)
+        self._last = None
+
+    def write(self, frame, repeat=1):
+        # Frames are views of the reused canvas buffer; only the last one is read, at close()
+        self._last = frame
+
+    def close(self):
+        # RGB whatever the source: in-process frames are RGBA, worker frames RGB
+        still = np.pad(self._last[..., :3], ((self.pad, self.pad), (self.pad, self.pad), (0, 0)), constant_values=255)
+        Image.fromarray(still).save(self.path, dpi=(self.dpi, self.dpi))
+
+def _init_worker(dpi, backend, text_entries):
+    """Start each worker with the parent's settings and text measurements already cached
+
+    Spawned workers re-import this module, so anything main() changes has
+    to be passed on here.
+    """
+    global DPI
+    DPI = dpi
+    use_backend(backend)
+    text_cache.seed(text_entries)
+
+def _render_runs(runs, text_entries=()):
+    """Render (frame_data, repeat) runs with this process's scene, as RGB arrays
+
+    `text_entries` are measurements the parent has made that this worker
+    has not been sent yet. Also returns the worker's text cache (hits,
+    misses) for this range.
+    """
+    text_cache.seed(text_entries)
+    rendered = []
+    for frame_data, repeat in runs:
+        update(frame_data)
+        rendered.append((scene.render()[..., :3].copy(), repeat))
+    return rendered, text_cache.take_counts()
+
+def _runs(frames):
+    """Collapse consecutive identical frame specs into (frame_data, repeat) pairs"""
+    for frame_data, run in itertools.groupby(frames):
+        yield frame_data, sum(1 for _ in run)
+
+def _chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+def _lay_out(runs, backend):
+    """Lay out `runs` on a LayoutScene, measuring their text into the cache without drawing
+
+    Only the strings measured count, as misses: the lookups are repeated
+    when the runs are rendered.
+    """
+    global scene
+    real, scene = scene, LayoutScene(backend)
+    hits = text_cache.hits
+    try:
+        for frame_data, _ in runs:
+            update(frame_data)
+    finally:
+        scene = real
+        text_cache.hits = hits
+
+def export(frames, sinks, jobs=1, dedupe=True):
+    """Render each run of identical frames once and feed the buffer to every sink
+
+    `frames` may be any iterable of frame specs, including a generator. It is
+    consumed lazily and every rendered frame goes straight to the sinks, so
+    memory does not grow with the length of the demo. With jobs > 1,
+    contiguous ranges of runs are rasterized in worker processes, each with
+    its own figure and scene, handed out in turn; a bounded number of ranges
+    is in flight and the results are streamed to the sinks in order. The
+    parent lays each range out without drawing it first and sends each
+    worker the measurements it has not had yet, so every string is measured
+    once for all workers. dedupe=False renders every frame, even repeats
+    (for benchmarking).
+
+    Returns (frames written, frames actually rendered).
+    """
+    written = rendered = 0
+    runs = _runs(frames) if dedupe else ((frame_data, 1) for frame_data in frames)
+
+    def emit(frame, repeat):
+        nonlocal written, rendered
+        for sink in sinks:
+            sink.write(frame, repeat)
+        written += repeat
+        rendered += 1
+
+    if jobs > 1:
+        # A few ranges per worker balances load while keeping ranges contiguous,
+        # so each worker's dirty-region renders stay cheap.
+        hint = operator.length_hint(frames)
+        chunk_size = max(1, hint // (jobs * 4)) if hint else 8
+        pending = collections.deque()
+        initial = text_cache.snapshot()
+        shared = {key for key, _ in initial}
+        # Measurements made since the workers started, and how many of them
+        # each worker has been sent
+        measured = []
+        sent = [0] * jobs
+
+        def emit_range():
+            results, (hits, misses) = pending.popleft().get()
+            text_cache.hits += hits
+            text_cache.misses += misses
+            for frame, repeat in results:
+                emit(frame, repeat)
+
+        with ExitStack() as stack:
+            # One single-process pool per worker, so the parent knows which
+            # worker renders each range and what it has already been sent
+            workers = [stack.enter_context(multiprocessing.Pool(1, initializer=_init_worker, initargs=(DPI, scene.backend, initial)))
+                       for _ in range(jobs)]
+            for index, chunk in enumerate(_chunked(runs, chunk_size)):
+                _lay_out(chunk, scene.backend)
+                new = text_cache.snapshot(exclude=shared)
+                shared.update(key for key, _ in new)
+                measured += new
+                worker = index % jobs
+                entries, sent[worker] = tuple(measured[sent[worker]:]), len(measured)
+                pending.append(workers[worker].apply_async(_render_runs, (chunk, entries)))
+                if len(pending) >= jobs * 2:
+                    emit_range()
+            while pending:
+                emit_range()
+    else:
+        for frame_data, repeat in runs:
+            update(frame_data)
+            emit(scene.render(), repeat)
+    for sink in sinks:
+        sink.close()
+    return written, rendered
+
+# Outputs selectable with --formats; make_sink(path, fps, mp4_preset)
+OutputFormat = collections.namedtuple('OutputFormat', ['label', 'filename', 'make_sink'])
+OUTPUT_FORMATS = {
+    # MP4 (primary format - crisp, small file)
+    'mp4': OutputFormat('MP4', 'dcf_apple_demo.mp4', lambda path, fps, preset: FFmpegSink(path, fps, MP4_PRESETS[preset])),
+    # WebM and animated WebP for browsers that support them (smaller). Opt-in:
+    # they need an ffmpeg built with libvpx, libaom and libwebp, and are slow to encode
+    'webm': OutputFormat('WebM (VP9)', 'dcf_apple_demo.webm', lambda path, fps, preset: FFmpegSink(path, fps, VP9_ARGS)),
+    'av1': OutputFormat('WebM (AV1)', 'dcf_apple_demo_av1.webm', lambda path, fps, preset: FFmpegSink(path, fps, AV1_ARGS)),
+    'webp': OutputFormat('WebP', 'dcf_apple_demo.webp', lambda path, fps, preset: FFmpegSink(path, fps, WEBP_ARGS)),
+    # GIF (fallback)
+    'gif': OutputFormat('GIF', 'dcf_apple_demo.gif', lambda path, fps, preset: GifSink(path, fps)),
+    # Final frame as PNG
+    'png': OutputFormat('Final frame', 'dcf_apple_demo_final.png', lambda path, fps, preset: PngSink(path, dpi=DPI)),
+}
+DEFAULT_FORMATS = ['mp4', 'gif', 'png']
+
+# Input hashes of the last build of each output, by output path. Kept next
+# to this script (and out of git) so it is never deployed with public/.
+MANIFEST = os.path.join(ASSET_DIR, '.dcf-build-manifest.json')
+
+def positive_int(value):
+    number = int(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"expected a positive integer, got {value}")
+    return number
+
+def frame_range(value):
+    """Parse --frames 'a:b' (either end optional) into a slice"""
+    start, sep, stop = value.partition(':')
+    if not sep:
+        raise argparse.ArgumentTypeError("expected a:b, e.g. 0:40 or 100:")
+    return slice(int(start) if start else None, int(stop) if stop else None)
+
+def content_hash(frames, settings):
+    """Hash of everything an output depends on: this script, the frame specs, the assets and the settings"""
+    digest = hashlib.sha256()
+    with open(__file__, 'rb') as f:
+        digest.update(f.read())
+    for frame_data in frames:
+        digest.update(repr(frame_data).encode())
+    for path in sorted(register_fonts()) + sorted(glob.glob(os.path.join(ASSET_DIR, '*.png'))):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    digest.update(json.dumps({**settings, 'matplotlib': mpl.__version__, 'pillow': PIL.__version__},
+                             sort_keys=True).encode())
+    return digest.hexdigest()
+
+def main():
+    global DPI
+    parser = argparse.ArgumentParser(description="Render the DCF demo animation for the website")
+    parser.add_argument('--formats', default=','.join(DEFAULT_FORMATS),
+                        help=f"comma-separated outputs from {','.join(OUTPUT_FORMATS)} (default: {','.join(DEFAULT_FORMATS)})")
+    parser.add_argument('--out-dir', default=os.path.normpath(os.path.join(ASSET_DIR, '..', '..', 'public', 'images')),
+                        help="output directory (default: public/images)")
+    parser.add_argument('--dpi', type=positive_int, default=DPI, help=f"figure resolution; the figure is 8x4in (default: {DPI})")
+    parser.add_argument('--fps', type=positive_int, default=10, help="frames per second (default: 10)")
+    parser.add_argument('--frames', type=frame_range, default=slice(None),
+                        help="only render frames a:b of the timeline, e.g. 0:40")
+    parser.add_argument('--jobs', type=positive_int, default=1, help="worker processes used to rasterize frames (default: 1)")
+    parser.add_argument('--backend', choices=BACKENDS, default='agg',
+                        help="agg draws with matplotlib; raster composites with NumPy and Pillow directly (default: agg)")
+    parser.add_argument('--preset', choices=MP4_PRESETS, default='web', help="MP4 encoder settings (default: web)")
+    parser.add_argument('--force', action='store_true', help="rebuild outputs even if their inputs are unchanged")
+    parser.add_argument('--profile', metavar='PATH', default=os.environ.get('DCF_PROFILE'),
+                        help="time the draw_* helpers and write folded stacks for flamegraph.pl to PATH "
+                             "(default: $DCF_PROFILE)")
+    args = parser.parse_args()
+    formats = args.formats.split(',')
+    for name in formats:
+        if name not in OUTPUT_FORMATS:
+            parser.error(f"unknown format {name!r}; choose from {','.join(OUTPUT_FORMATS)}")
+    if len(range(*args.frames.indices(len(timeline)))) == 0:
+        parser.error(f"--frames selects no frames; the timeline has {len(timeline)}")
+    DPI = args.dpi
+    use_backend(args.backend)
+
+    profiler = None
+    if args.profile:
+        profiler = install_profiler()
+        # Only this process is profiled
+        args.jobs = 1
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    try:
+        with open(MANIFEST) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        manifest = {}
+
+    # Skip outputs whose file exists and was built from identical inputs
+    def frames():
+        return itertools.islice(timeline, *args.frames.indices(len(timeline)))
+    settings = dict(dpi=args.dpi, fps=args.fps, backend=args.backend, frames=[args.frames.start, args.frames.stop])
+    sinks = {}
+    hashes = {}
+    failed = []
+    for name in formats:
+        output = OUTPUT_FORMATS[name]
+        path = os.path.join(args.out_dir, output.filename)
+        hashes[name] = content_hash(frames(), {**settings, 'format': name, 'preset': args.preset if name == 'mp4' else None})
+        if args.force or not os.path.exists(path) or manifest.get(os.path.abspath(path)) != hashes[name]:
+            sink = output.make_sink(path, args.fps, args.preset)
+            # A missing encoder only costs that output, not the whole build
+            if isinstance(sink, FFmpegSink) and sink.encoder not in ffmpeg_encoders():
+                print(f"✗ {output.label}: ffmpeg was built without the {sink.encoder} encoder, skipped")
+                failed.append(name)
+                continue
+            sinks[name] = sink
+        else:
+            print(f"✓ {output.label}: {path} (unchanged, skipped)")
+    if not sinks:
+        if failed:
+            raise SystemExit(1)
+        return
+
+    written, rendered = export(frames(), list(sinks.values()), jobs=args.jobs)
+    plt.close('all')
+
+    for name, sink in list(sinks.items()):
+        if getattr(sink, 'error', None):
+            print(f"✗ {OUTPUT_FORMATS[name].label}: {sink.error} writing {sink.path}")
+            if os.path.exists(sink.path):
+                os.remove(sink.path)
+            failed.append(name)
+            del sinks[name]
+            continue
+        manifest[os.path.abspath(sink.path)] = hashes[name]
+    # Saved before the quality check, which re-decodes every output
+    with open(MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    for name, sink in sinks.items():
+        output = OUTPUT_FORMATS[name]
+        size = os.path.getsize(sink.path) / 1024
+        quality = ""
+        if isinstance(sink, EncodedSink):
+            # Only a figure to report; a file that can't be read back here may still be fine
+            try:
+                psnr = sink.psnr()
+            except (OSError, ValueError, EOFError) as error:
+                print(f"  (PSNR of {sink.path} unavailable: {error})")
+                psnr = None
+            if psnr is not None:
+                quality = f", PSNR {psnr:.1f} dB"
+        print(f"✓ {output.label}: {sink.path} ({size:.0f}KB{quality})")
+
+    if 'mp4' in sinks:
+        print(f"✓ MP4 encoder: {args.preset} preset, encoded at {sinks['mp4'].fps_encoded:.0f} fps")
+    print(f"✓ Total frames: {written} ({rendered} rendered, rest are repeated holds)")
+    print(f"✓ Duration: ~{written / args.fps:.1f} seconds at {args.fps}fps")
+    print(f"✓ Text layout cache: {text_cache.hits} hits, {text_cache.misses} misses")
+    if profiler:
+        profiler.report()
+        profiler.dump_folded(args.profile)
+        print(f"✓ Profile saved as: {args.profile} (folded stacks, e.g. flamegraph.pl {args.profile} > profile.svg)")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()